@@ -26,7 +26,7 @@
 # 
 
 from dotenv import dotenv_values
-from owlmind.pipeline import ModelProvider
+from owlmind.pipeline import AdmissionControl, Metrics, ModelProvider, ProviderPool
 from owlmind.simple import SimpleEngine
 from owlmind.discord import DiscordBot
 
@@ -39,9 +39,28 @@ if __name__ == '__main__':
     MODEL = config['SERVER_MODEL'] if 'SERVER_MODEL' in config else None
     TYPE = config['SERVER_TYPE'] if 'SERVER_TYPE' in config else None
     API_KEY = config['SERVER_API_KEY'] if 'SERVER_API_KEY' in config else None
+    METRICS_PORT = config['METRICS_PORT'] if 'METRICS_PORT' in config else None
+    KEEP_ALIVE = config['SERVER_KEEP_ALIVE'] if 'SERVER_KEEP_ALIVE' in config else None
+    PING_INTERVAL = float(config['SERVER_PING_INTERVAL']) if 'SERVER_PING_INTERVAL' in config else None
+    MAX_CONCURRENT = int(config['SERVER_MAX_CONCURRENT']) if 'SERVER_MAX_CONCURRENT' in config else AdmissionControl.MAX_CONCURRENT
+    MAX_QUEUE = int(config['SERVER_MAX_QUEUE']) if 'SERVER_MAX_QUEUE' in config else AdmissionControl.MAX_QUEUE
+    MAX_WAIT = float(config['SERVER_MAX_WAIT']) if 'SERVER_MAX_WAIT' in config else None
 
-    # Configure a ModelProvider if there is an URL
-    provider = ModelProvider(type=TYPE,  base_url=URL, api_key=API_KEY, model=MODEL) if URL else None
+    # Ollama takes keep_alive as a duration ('30m') or in seconds (-1 keeps the model loaded for ever)
+    if KEEP_ALIVE and KEEP_ALIVE.lstrip('-').isdigit(): KEEP_ALIVE = int(KEEP_ALIVE)
+
+    # Expose Model Provider metrics (Prometheus text) on http://127.0.0.1:{METRICS_PORT}/metrics
+    if METRICS_PORT: Metrics.DEFAULT.serve(port=int(METRICS_PORT))
+
+    # Configure a ModelProvider if there is an URL (or a pool of them, for a comma-separated list of URLs)
+    # The model is warmed up when the bot connects, and pinged again after PING_INTERVAL idle seconds
+    providers = [ModelProvider(type=TYPE,  base_url=url.strip(), api_key=API_KEY, model=MODEL, 
+                               keep_alive=KEEP_ALIVE, ping_interval=PING_INTERVAL) for url in URL.split(',')] if URL else []
+    provider = ProviderPool(providers) if len(providers) > 1 else (providers[0] if providers else None)
+
+    # At most MAX_CONCURRENT prompts reach the model at once, MAX_QUEUE more wait (DMs and short prompts first);
+    # beyond that, or after MAX_WAIT seconds waiting, the bot answers 'busy' instead of piling up requests
+    if provider: provider = AdmissionControl(provider, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE, max_wait=MAX_WAIT)
 
     # Load Simples Bot Brain loading rules from a CSV
     engine = SimpleEngine(id='bot-1')
@@ -49,6 +68,6 @@ if __name__ == '__main__':
     engine.load('rules/bot-rules-3.csv')
 
     # Kick start the Bot Runner process
-    bot = DiscordBot(token=TOKEN, engine=engine, debug=True)
+    bot = DiscordBot(token=TOKEN, engine=engine, debug=True, streaming=True)
     bot.run()
 
@@ -23,6 +23,11 @@
 # Generative AI has been used extensively while developing this package.
 # 
 
+import time
+import asyncio
+import datetime
+import threading
+from collections import OrderedDict, deque
 from .agent import Agent, Plan
 from .context import Context
 
@@ -34,31 +39,202 @@ class BotMessage(Context):
     #BASE_STANDARD = '.;'
     """
     Message format being passed to/from BotBrain logic
+
+    The engine answers in 'response', or (when streaming) in 'stream', an async iterator over the pieces of the response.
+
+    Default FIELDS are copied in one step; DERIVED fields (e.g. date, time) are only computed
+    the first time a rule, a template or the engine reads them, and then kept in the message.
+    Subclasses can extend DERIVED (e.g. reading the names from the original message in 'source').
+
+    Example:
+    m = BotMessage(message='hello')
+    print(m['message'], m['date'])
     """
-    def __init__(self, **kwargs):
-        
-        # Load default fields and update with parameters
-        default_fields = {
-            'layer1': 0,               # Server ID (guild ID or 0 for DM)
-            'layer2': 0,               # Channel ID (or 0 for DM)
-            'layer3': 0,               # Thread ID (0 if no thread)
-            'layer4': None,            # Author ID
-            'server_name': '',         # Server name (or '#dm' for direct message)
-            'channel_name': '',        # Channel name (or '#dm' for DM)
-            'thread_name': '',         # Thread name (empty if no thread)
-            'author_name': '',         # Author name (username)
-            'author_fullname': '',     # Author full name (global_name)
-            'message': '',             # Message content
-            'attachments': None,       # Attachments in the message
-            'reactions': None          # Reactions to the message
-        }
-
-        default_fields.update(kwargs)
+
+    # Default fields (eager, unless DERIVED)
+    FIELDS = {
+        'layer1': 0,               # Server ID (guild ID or 0 for DM)
+        'layer2': 0,               # Channel ID (or 0 for DM)
+        'layer3': 0,               # Thread ID (0 if no thread)
+        'layer4': None,            # Author ID
+        'server_name': '',         # Server name (or '#dm' for direct message)
+        'channel_name': '',        # Channel name (or '#dm' for DM)
+        'thread_name': '',         # Thread name (empty if no thread)
+        'author_name': '',         # Author name (username)
+        'author_fullname': '',     # Author full name (global_name)
+        'message': '',             # Message content
+        'attachments': None,       # Attachments in the message
+        'reactions': None          # Reactions to the message
+    }
+
+    # Fields computed on first access: name -> function(BotMessage)
+    DERIVED = {
+        'timestamp': lambda m: datetime.datetime.fromtimestamp(m.created),
+        'date': lambda m: m['timestamp'].strftime("%d-%b-%Y"),  # Format date as '25-Feb-2024'
+        'time': lambda m: m['timestamp'].strftime("%H:%M:%S"),  # Format time as '20:58:14'
+    }
+
+    # Context keeps a '__dict__', so these slots only give fast attribute access, not a smaller layout
+    __slots__ = ('source', 'created', 'response', 'stream', 'result', 'score', 'alternatives')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._EAGER = {key: value for key, value in cls.FIELDS.items() if key not in cls.DERIVED}
+        return
+
+    def __init__(self, source=None, **kwargs):
         
-        # Initialize Context
-        super().__init__(facts=default_fields)
+        # Initialize Context, then load default fields and update with parameters
+        super().__init__()
+        self.source = source
+        self.created = time.time()
+        self.response = self.stream = self.result = self.alternatives = None
+        self.score = 0
+
+        dict.update(self, self._EAGER)
+        for key, value in kwargs.items():
+            if isinstance(value, Context):
+                self[key] = value   #-> link sub-context
+            else:
+                dict.__setitem__(self, key, value)
         return 
 
+    def __missing__(self, key):
+        """
+        Compute a DERIVED field on first access and keep it.
+        """
+        derive = self.DERIVED.get(key)
+        if derive is None:
+            return None
+        value = derive(self)
+        dict.__setitem__(self, key, value)
+        self._changed()
+        return value
+
+BotMessage._EAGER = {key: value for key, value in BotMessage.FIELDS.items() if key not in BotMessage.DERIVED}
+
+
+##
+## CONVERSATION MEMORY
+## Recent turns of each conversation, added to the prompts sent to the Model Provider
+##
+
+class ConversationSession():
+    """
+    Turns of one conversation, as (text, tokens), with their total tokens and the time of the last turn
+    """
+    __slots__ = ('turns', 'tokens', 'used')
+
+    def __init__(self, max_turns:int):
+        self.turns = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.used = time.time()
+        return
+
+
+class ConversationMemory():
+    """
+    Bounded store of the recent turns (message and answer) of each conversation, keyed by the BotMessage layers
+    (layer1..layer4: server, channel, thread and author), so each author has one conversation per channel.
+
+    Each conversation keeps its last 'max_turns' turns, dropping the oldest ones beyond 'max_tokens'
+    (estimated as CHARS_PER_TOKEN characters per token), so the history added to a prompt is capped.
+    At most 'max_sessions' conversations are kept, dropping the least recently used ones first;
+    conversations idle for more than 'ttl' seconds are forgotten.
+
+    Example:
+    memory = ConversationMemory(max_tokens=500)
+    prompt = instructions + '\n' + memory.history(context) + context['message']
+    memory.add(context, context['message'], answer)
+    """
+    MAX_TOKENS = 1000
+    MAX_TURNS = 20
+    MAX_SESSIONS = 10000
+    TTL = 3600.0
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, max_tokens:int=MAX_TOKENS, max_turns:int=MAX_TURNS, max_sessions:int=MAX_SESSIONS, ttl:float=TTL):
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # key -> ConversationSession, least recently used first
+        self._lock = threading.Lock()
+        return
+
+    @staticmethod
+    def key(context:BotMessage) -> tuple:
+        return (context['layer1'], context['layer2'], context['layer3'], context['layer4'])
+
+    @classmethod
+    def tokens(cls, text:str) -> int:
+        """ Estimated number of tokens of a text """
+        return -(-len(text) // cls.CHARS_PER_TOKEN)
+
+    def _expire(self, now:float):
+        """ Drop the idle conversations (the least recently used come first) """
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if self.ttl is None or now - session.used <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+        return
+
+    def add(self, context:BotMessage, message:str, answer:str):
+        """
+        Remember one turn of the conversation of the context
+        """
+        text = f'User: {message}\nAssistant: {answer}\n'
+        budget = self.max_tokens * self.CHARS_PER_TOKEN
+        if len(text) > budget:
+            text = text[-budget:]
+        tokens = self.tokens(text)
+        key, now = self.key(context), time.time()
+
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.pop(key, None) or ConversationSession(self.max_turns)
+            if len(session.turns) == session.turns.maxlen:
+                session.tokens -= session.turns[0][1]
+            session.turns.append((text, tokens))
+            session.tokens += tokens
+            while session.tokens > self.max_tokens:
+                session.tokens -= session.turns.popleft()[1]
+            session.used = now
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return
+
+    def history(self, context:BotMessage) -> str:
+        """
+        Recent turns of the conversation of the context, oldest first ('' if there are none)
+        """
+        key, now = self.key(context), time.time()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(key)
+            if session is None:
+                return ''
+            self._sessions.move_to_end(key)
+            session.used = now
+            return ''.join(text for text, _ in session.turns)
+
+    def forget(self, context:BotMessage):
+        """
+        Drop the conversation of the context
+        """
+        with self._lock:
+            self._sessions.pop(self.key(context), None)
+        return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'sessions': len(self._sessions), 'tokens': sum(session.tokens for session in self._sessions.values())}
+
+    def __len__(self):
+        return len(self._sessions)
+
 
 ##
 ## BASE CLASS FOR BOT ENGINE
@@ -70,10 +246,17 @@ class BotEngine(Agent):
     """  
     def __init__(self, id):
         self.debug = False
+        self.streaming = False  # answer Model Provider prompts through BotMessage.stream
         self.announcement = None
         super().__init__(id)
 
     def process(self, context:BotMessage):
         super().process(context=context)
 
+    async def aprocess(self, context:BotMessage):
+        """
+        Process a message from an event loop; engines without a native asyncio path run process() on a worker thread.
+        """
+        await asyncio.to_thread(self.process, context)
+
 
@@ -25,9 +25,25 @@
 # Generative AI has been used extensively while developing this package.
 # 
 
+import os
 import re
+import sys
+import json
+import math
+import pickle
+import time
+import threading
+import multiprocessing
+import heapq
 import random
-from collections.abc import Iterable
+from bisect import bisect_left, insort
+from functools import lru_cache
+from hashlib import blake2b
+from typing import NamedTuple
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError: # Python < 3.11
+    import sre_parse, sre_constants
 
 class Context(dict):
     """
@@ -52,10 +68,14 @@ class Context(dict):
 
     VERSION = "1.3"
 
+    # Core attributes live in slots; '__dict__' keeps ad-hoc attributes (result, score, ...) available
+    __slots__ = ('namespace', 'parent', '_matcher', '_fingerprint', '__dict__')
+
     _ = '_'
     MAX_CLAUSE = 100.0
     CASE_SENSITIVE = False
     DEBUG = True
+    REGEX_BUDGET = 0.1  # seconds per message for the regexes flagged as catastrophic-backtracking (see RegexGuard), None to run them inline
 
     def __init__(self, facts=None, namespace=None, parent=None):
         """
@@ -63,15 +83,56 @@ class Context(dict):
         """
         self.namespace = namespace
         self.parent = parent
+        self._matcher = None
+        self._fingerprint = None
         if facts:
             self.__iadd__(facts=facts)
         return
 
     def __hash__(self):
         """
-        Return specific hash value
+        Return specific hash value, based on content (see Context.fingerprint)
+        """
+        return self.fingerprint()
+
+    def fingerprint(self) -> int:
+        """
+        Content-based fingerprint of this Context (facts and sub-Contexts, not parent nor namespace).
+        Computed once and kept until the Context is changed; stable across processes.
+        Unhashable values (lists, dicts, sets) are supported, but changing them in place is not tracked.
+
+        Example:
+        c1 = Context({'code':'3333', 'files': ['a.txt']})
+        c2 = Context({'files': ['a.txt'], 'code':'3333'})
+        print(c1.fingerprint() == c2.fingerprint()) #-> True
         """
-        return hash(tuple(sorted(self.items())))
+        if self._fingerprint is None:
+            self._fingerprint = Context.digest(self)
+        return self._fingerprint
+
+    @staticmethod
+    def digest(value) -> int:
+        """ Stable 64-bit digest of any (nested) value, see Context.canonical """
+        text = Context.canonical(value, top=True)
+        return int.from_bytes(blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'big', signed=True)
+
+    @staticmethod
+    def canonical(value, top:bool=False) -> str:
+        """
+        Canonical, order-independent text form of a value, used for fingerprints.
+        Sub-Contexts contribute their own (cached) fingerprint.
+        """
+        if isinstance(value, Context) and not top:
+            return f'@{value.fingerprint()}'
+        elif isinstance(value, dict):
+            items = sorted(f'{key!r}:{Context.canonical(fact)}' for key, fact in value.items() if key != '..')
+            return '{' + ','.join(items) + '}'
+        elif isinstance(value, (list, tuple)):
+            items = ','.join(Context.canonical(element) for element in value)
+            return f'[{items}]' if isinstance(value, list) else f'({items})'
+        elif isinstance(value, (set, frozenset)):
+            return '{' + ','.join(sorted(Context.canonical(element) for element in value)) + '}'
+        return f'{value.__class__.__name__}:{value!r}'
 
     def __setitem__(self, key, fact):
         """
@@ -91,18 +152,57 @@ class Context(dict):
         print(c)
         print(c1)
         """
-        if '/' not in key:
+        if key.__class__ is ContextPath:
+            key.set(self, fact)
+        elif '/' not in key:
             dict.__setitem__(self, key, fact)
+            self._changed()
             if isinstance(fact, Context):
                 setattr(fact, 'parent', self)
                 #dict.__setitem__(fact, '..', self)
         else:
-            part, remaining = key.split('/', maxsplit=1)
-            value1 = super().get(part, None)
-            if not value1:
-                value1 = Context()
-                self.__setitem__(part, value1)
-            value1[remaining] = fact
+            Context.path(key).set(self, fact)
+        return
+
+    # The other dict mutators also drop the compiled forms and fingerprint (see _changed)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed()
+        return
+
+    def update(self, facts=(), **kwargs):
+        """ Same as dict.update, setting each fact through __setitem__ """
+        for key, fact in (facts.items() if hasattr(facts, 'items') else facts):
+            self.__setitem__(key, fact)
+        for key, fact in kwargs.items():
+            self.__setitem__(key, fact)
+        return
+
+    def __ior__(self, facts):
+        self.update(facts)
+        return self
+
+    def setdefault(self, key, default=None):
+        if not dict.__contains__(self, key):
+            self.__setitem__(key, default)
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, *default):
+        changed = dict.__contains__(self, key)
+        value = dict.pop(self, key, *default)
+        if changed:
+            self._changed()
+        return value
+
+    def popitem(self):
+        item = dict.popitem(self)
+        self._changed()
+        return item
+
+    def clear(self):
+        dict.clear(self)
+        self._changed()
         return
     
 
@@ -128,18 +228,36 @@ class Context(dict):
 
         if key is None:
             return None
+        elif key.__class__ is ContextPath:
+            return key.get(self)
         elif key == '.':
             return self
         elif key == '..':
             return self.parent
         elif '/' not in key:
-            return super().get(key, None)
-        else:
-            part, remaining = key.split('/', maxsplit=1)
-            value1 = self[part]
-            if isinstance(value1, Context) or isinstance(value1, dict):
-                return value1[remaining]
-        return
+            return dict.__getitem__(self, key) #-> missing keys go through __missing__
+        return Context.path(key).get(self)
+
+    def __missing__(self, key):
+        """
+        Value for a key that is not in the Context; subclasses may derive it on demand (see BotMessage).
+        """
+        return None
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def path(key:str):
+        """
+        Return the interned ContextPath for a slash-separated key.
+        ContextPaths can be used as keys wherever a string key is accepted.
+
+        Example:
+        code = Context.path('api/code')
+        c = Context()
+        c[code] = '2345'
+        print(c[code], c['api/code'])
+        """
+        return ContextPath(key)
     
     def __iadd__(self, facts):
         """
@@ -167,35 +285,25 @@ class Context(dict):
         return self
 
 
+    def _changed(self):
+        """
+        Drop compiled forms and fingerprint of this Context (and of the Contexts above it) after a mutation.
+        """
+        node = self
+        while node is not None and (getattr(node, '_matcher', None) is not None or getattr(node, '_fingerprint', None) is not None):
+            node._matcher = None
+            node._fingerprint = None
+            node = getattr(node, 'parent', None)
+        return
+
+
     ##
     ## LOGIC FOR CONTEXT MATCHING 
     ###
     @staticmethod
     def _match_str(test:str, target:str):
-        """ Inner Logic for matching strings in Context-match """
-        score = 0
-
-        if not Context.CASE_SENSITIVE:
-            test = test.lower()
-            target = target.lower()
-
-        if test == target:  #-> String matching
-            score += 1.0
-        elif test == Context._ or test == '*':
-            score += 0.25
-        elif '*' in test:
-            non_wildcard_count = len([char for char in test if char != '*'])
-            if re.fullmatch(test.replace('*', '.*'), target):
-                score += 0.5 + (0.49 * (non_wildcard_count / len(target)))
-        elif test.startswith('r/'): 
-            pattern = test[2:-1] if test.endswith('/') else test[2:] 
-            try:
-                if re.fullmatch(pattern, str(target)): 
-                    score += 0.75
-            except re.error:
-                if Context.DEBUG: print(f'WARNING: Context.__contains__, regex expecting: {pattern}')
-                pass 
-        return score
+        """ Inner Logic for matching strings in Context-match (see ContextClause) """
+        return ContextClause(None, test).score(target)
 
         
     def __contains__(self, test) -> bool:
@@ -212,10 +320,24 @@ class Context(dict):
             if Context.DEBUG: print(f'WARNING: Context.__contains__, invalid type: {type(test)}')
         return False
 
+    def matcher(self):
+        """
+        Return the compiled form of this Context when used as a Context-test.
+        Compiled once and kept until the Context is changed.
+
+        Example:
+        t = Context({'message':'*hello*'})
+        print(t.matcher().match(Context({'message':'hello there'})))
+        """
+        if self._matcher is None:
+            self._matcher = ContextMatcher(self)
+        return self._matcher
+
     def match(self, test) -> bool:
         """
         Context-matching logic.
         This is the key logic behind Context-matching and ContextRepos used for the Rule-based deliberation.
+        The Context-test is compiled once (see Context.matcher) and executed against this Context.
 
         Functionality:
         Test-Context in Target-Context
@@ -232,40 +354,8 @@ class Context(dict):
             return False
 
         # PROCESSING
-        test.subs = {}
         test.key = ''
-        test.score = 0
-
-        for key in test.keys():
-            if key == '..':
-                continue
-
-            score = 0
-            testing = test[key]
-            target = self[key] if dict.__contains__(self, key) else None
-
-            ##  @TODO must be able to match values of different types (https://github.com/GenILab-FAU/owlmind/issues/6)
-            ##
-
-            if not target:
-                pass
-
-            elif isinstance(testing, Context) and isinstance(target, Context):
-                target.__contains__(testing)
-                score = testing.score
-
-            elif isinstance(testing, str) and isinstance(target, str):
-                score = Context._match_str(testing, target)
-
-            # If there was a Context-key-value match, accumulate; otherwise break with fail!
-            if score:
-                test.subs[key] = target
-                test.score += Context.MAX_CLAUSE + score
-            else:
-                test.score = 0
-                test.subs = None
-                break
-        
+        test.score, test.subs = test.matcher().match(self)
         return bool(test.score)
         
     def find(self, key):
@@ -282,17 +372,51 @@ class Context(dict):
         c = Context(parent=sc)
         print(c.find('code'))
         """
-        if key in self:
-            return self[key]
-        elif self.parent:
-            return self.parent.find(key)
+        if key.__class__ is ContextPath or '/' in key:
+            path = key if key.__class__ is ContextPath else Context.path(key)
+            return path.find(self)
+
+        node = self
+        while node is not None:
+            value = dict.__getitem__(node, key) #-> through __missing__, for facts derived on demand
+            if value is not None or dict.__contains__(node, key):
+                return value
+            node = node.parent
         return None
 
+    # Regex for matching $varid and ${varid}, where varid can include special characters
+    TEMPLATE = re.compile(r"\$(\w+)|\$\{([\w/]+)\}")
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def template(sentence:str) -> tuple:
+        """
+        Parse a sentence once into a tuple of segments: literal strings and (var_id, source) references;
+        var_ids with '/' are pre-split into ContextPaths.
+        Parsed sentences are kept in an LRU cache, keyed by the sentence itself.
+
+        Example:
+        print(Context.template('The code for $name is ${api/code}'))
+        #-> ('The code for ', ('name', '$name'), ' is ', (ContextPath('api/code'), '${api/code}'))
+        """
+        segments = []
+        pos = 0
+        for match in Context.TEMPLATE.finditer(sentence):
+            if match.start() > pos:
+                segments.append(sentence[pos:match.start()])
+            var_id = match.group(1) or match.group(2) # Match either $varid or ${varid}
+            segments.append( (Context.path(var_id) if '/' in var_id else var_id, match.group(0)) )
+            pos = match.end()
+        if pos < len(sentence):
+            segments.append(sentence[pos:])
+        return tuple(segments)
+
     def compile(self, sentence):
         """ 
         Compile a sentence (str) or sequence of sentences.
         Compilation means to replace $var_id or ${var_id} with values in Context, when these values are also Strings.
         If the target value is not an String, replace with a pointer.
+        The sentence is parsed once (see Context.template); compiling only resolves the variables.
         
         Functionality:
         Context.compile(SENTENCE)
@@ -308,17 +432,513 @@ class Context(dict):
             # Recursively process each element of the sequence
             result = type(sentence)(self.compile(element) for element in sentence)
         elif isinstance(sentence, str):
-            # Regex for matching $varid and ${varid}, where varid can include special characters
-            pattern = r"\$(\w+)|\$\{([\w/]+)\}"
+            result = self.render(Context.template(sentence))
+        return result
 
-            def substitute(match):
-                var_name = match.group(1) or match.group(2)  # Match either $varid or ${varid}
-                value = self.find(var_name)
-                value = match.group(0) if value is None else value 
-                return str(value) if isinstance(value, str) else f"<pointer to {value}>"
+    def render(self, segments:tuple) -> str:
+        """
+        Join a parsed sentence (see Context.template), resolving its variables in this Context.
+        """
+        if len(segments) == 1 and segments[0].__class__ is str:
+            return segments[0] #-> fixed string, nothing to resolve
+
+        parts = []
+        for segment in segments:
+            if segment.__class__ is str:
+                parts.append(segment)
+                continue
+            var_id = segment[0]
+            value = var_id.find(self) if var_id.__class__ is ContextPath else self.find(var_id)
+            if value is None:
+                parts.append(segment[1])
+            else:
+                parts.append(value if isinstance(value, str) else f"<pointer to {value}>")
+        return ''.join(parts)
+
+###
+### CONTEXT PATHS
+###
+
+class ContextPath():
+    """
+    Pre-split slash-separated key, resolved with a loop instead of one split and recursion per level.
+    Build it through Context.path(key), which interns it.
+
+    Path segments:
+    'key'     : fact at this level
+    '.'       : this level
+    '..'      : parent Context
+    '*'       : the rest of the path, looked up at this level or any parent
+    """
+
+    __slots__ = ('key', 'parts', 'head', 'rest')
+
+    def __init__(self, key:str):
+        self.key = key
+        self.parts = tuple(part for part in key.split('/') if part != '.')
+        self.head = self.parts
+        self.rest = None
+        if '*' in self.parts:
+            star = self.parts.index('*')
+            self.head = self.parts[:star]
+            self.rest = ContextPath('/'.join(self.parts[star+1:])) if star + 1 < len(self.parts) else None
+        return
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.key!r})'
+
+    def get(self, context):
+        """ Resolve this path from a Context, None if any level is missing """
+        node = context
+        for part in self.head:
+            if part == '..':
+                node = node.parent if isinstance(node, Context) else None
+            elif isinstance(node, Context):
+                node = dict.__getitem__(node, part)
+            elif isinstance(node, dict):
+                node = dict.get(node, part)
+            else:
+                return None
+            if node is None:
+                return None
+
+        if self.rest is None:
+            return node
+
+        # '*/...' : first level (this one or a parent) where the rest of the path resolves
+        while node is not None:
+            value = self.rest.get(node)
+            if value is not None:
+                return value
+            node = node.parent if isinstance(node, Context) else None
+        return None
+
+    def find(self, context):
+        """ Resolve this path from the first Context (this one or a parent) holding its first key """
+        if not self.head or self.head[0] == '..':
+            return self.get(context)
+        
+        first = self.head[0]
+        node = context
+        while node is not None:
+            if dict.__getitem__(node, first) is not None or dict.__contains__(node, first):
+                return self.get(node)
+            node = node.parent
+        return None
+
+    def set(self, context, fact):
+        """ Set a fact at the end of this path, creating sub-Contexts as needed ('*' is a plain key here) """
+        parts = self.parts
+        node = context
+        for part in parts[:-1]:
+            if part == '..':
+                node = node.parent
+                if node is None:
+                    if Context.DEBUG: print(f'WARNING: ContextPath.set, no parent Context for {self.key}')
+                    return
+                continue
+            value = dict.get(node, part)
+            if not value:
+                value = Context()
+                node[part] = value
+            node = value
+        node[parts[-1]] = fact
+        return
+
+
+###
+### COMPILED CONTEXT-TEST
+###
+
+class RegexBudget():
+    """
+    Time left (seconds) for the guarded regexes of one message, shared by all of them (see ContextRepo.match)
+    """
+    __slots__ = ('left',)
+
+    def __init__(self, seconds:float):
+        self.left = seconds
+        return
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.left:.3f})'
+
+
+class RegexGuard():
+    """
+    Regex flagged by ContextClause.backtracking, matched under a time budget.
+
+    Python's re cannot be interrupted, so the match runs on a watchdog process, shared by every guard.
+    It is started from a fork server where possible (the bot is multi-threaded by then, so it is never forked 
+    directly); elsewhere it is spawned, which needs the usual "if __name__ == '__main__':" guard.
+    
+    The budget is a RegexBudget shared by every guarded clause tested for one message (see ContextRepo.match),
+    a new one of Context.REGEX_BUDGET seconds by default; only the time waiting for the watchdog's answer 
+    is taken from it. Once it is spent, the match fails without running; when the watchdog does not answer
+    in time, it is killed (to be restarted on the next message), the match fails, and the overrun is 
+    counted in 'overruns'.
+
+    Example:
+    guard = RegexGuard('(a+)+b', 'nested repeat')
+    print(guard.fullmatch('a' * 40))  #-> False, after Context.REGEX_BUDGET seconds
+    print(guard.overruns)             #-> 1
+    """
+
+    STARTUP = 30.0   # seconds for the watchdog process to start
+    _lock = threading.Lock()
+    _worker = None   # (process, connection)
+
+    __slots__ = ('pattern', 'risk', 'overruns')
+
+    def __init__(self, pattern:str, risk:str=None):
+        self.pattern = pattern
+        self.risk = risk
+        self.overruns = 0
+        return
+
+    def fullmatch(self, text:str, budget:RegexBudget=None) -> bool:
+        """ True if the pattern matches the whole text within the budget """
+        if budget is None:
+            budget = RegexBudget(Context.REGEX_BUDGET)
+        elif budget.left <= 0:
+            return False #-> the budget of this message is spent
+        
+        with RegexGuard._lock:
+            try:
+                process, connection = RegexGuard._worker or RegexGuard._start()
+            except OSError as e:
+                if Context.DEBUG: print(f'WARNING: RegexGuard, no watchdog ({e}), matching {self.pattern!r} inline')
+                return re.fullmatch(self.pattern, text) is not None
+            
+            try:
+                connection.send((self.pattern, text))
+                started = time.monotonic()
+                answered = connection.poll(budget.left)
+                budget.left -= time.monotonic() - started
+                if answered:
+                    return connection.recv()
+            except (OSError, EOFError):
+                pass
+            process.kill()
+            process.join()
+            RegexGuard._worker = None
+
+        self.overruns += 1
+        if Context.DEBUG: print(f'WARNING: RegexGuard, {self.pattern!r} over budget ({self.risk}), {len(text)} chars')
+        return False
+
+    @staticmethod
+    def _start():
+        """ Start the watchdog process, waiting until it is ready """
+        start = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        start = multiprocessing.get_context(start)
+        connection, child = start.Pipe()
+        process = start.Process(target=RegexGuard._serve, args=(child,), name='owlmind-regex-guard', daemon=True)
+        process.start()
+        child.close()
+        if not connection.poll(RegexGuard.STARTUP):
+            process.kill()
+            raise OSError('watchdog process did not start')
+        connection.recv()
+        RegexGuard._worker = (process, connection)
+        return RegexGuard._worker
+
+    @staticmethod
+    def _serve(connection):
+        """ Watchdog process: answer (pattern, text) with whether pattern fullmatches text """
+        sys.stdout = sys.stderr = open(os.devnull, 'w') #-> keep the bot's console for the bot
+        connection.send(True) #-> ready
+        while True:
+            try:
+                pattern, text = connection.recv()
+            except (EOFError, KeyboardInterrupt):
+                return
+            connection.send(re.fullmatch(pattern, text) is not None)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.pattern!r}, {self.risk!r})'
+
+
+class ContextClause():
+    """
+    Compiled test for one key of a Context-test.
+    Literals are folded, patterns compiled and score components computed once, at construction.
+
+    Scoring (added to Context.MAX_CLAUSE for each clause that matches):
+    'value'     : 1.0   exact match (for any test, when test and target are the same string)
+    '*' or '_'  : 0.25  any non-empty value
+    'r/regex/'  : 0.75  regex fullmatch
+    'hi*there'  : 0.5 + 0.49 * (non-wildcard chars / len(target)), wildcard fullmatch
+    Context     : score of the sub-Context test against the sub-Context target
+
+    bound is the highest score the clause can reach unless the target is the test string itself,
+    ceiling is the highest score it can reach at all.
+
+    Example:
+    clause = ContextClause('message', '*hello*')
+    print(clause.score('Hello there'))
+    """
+
+    EXACT, ANY, WILDCARD, REGEX, CONTEXT, NONE = range(6)
+
+    EXACT_SCORE = 1.0
+    ANY_SCORE = 0.25
+    REGEX_SCORE = 0.75
+    WILDCARD_SCORE = 0.5
+    WILDCARD_SPAN = 0.49
+
+    # Characters that turn a wildcard into a regular expression
+    REGEX_CHARS = frozenset('\\.^$+?{}[]|()')
+
+    __slots__ = ('key', 'test', 'kind', 'literal', 'pattern', 'risk', 'literal_count', 'sub', 'bound', 'ceiling')
+
+    def __init__(self, key, test):
+        self.key = key
+        self.test = test
+        self.kind = ContextClause.NONE
+        self.literal = None
+        self.pattern = None
+        self.risk = None
+        self.literal_count = 0
+        self.sub = None
+        self.bound = self.ceiling = 0
+
+        if isinstance(test, Context):
+            self.kind = ContextClause.CONTEXT
+            self.sub = test.matcher()
+            self.bound = self.ceiling = self.sub.ceiling
+        elif isinstance(test, str):
+            self.literal = test if Context.CASE_SENSITIVE else test.lower()
+            literal = self.literal
+            if literal == Context._ or literal == '*':
+                self.kind = ContextClause.ANY
+                self.bound = ContextClause.ANY_SCORE
+            elif '*' in literal:
+                self.kind = ContextClause.WILDCARD
+                self.literal_count = len(literal) - literal.count('*')
+                self.pattern = self._compile(literal.replace('*', '.*'))
+                # Plain wildcards only match targets holding all their literals (len(target) >= literal_count)
+                ratio = self.literal_count if ContextClause.REGEX_CHARS.intersection(literal) else 1.0
+                self.bound = ContextClause.WILDCARD_SCORE + (ContextClause.WILDCARD_SPAN * ratio)
+            elif literal.startswith('r/'):
+                self.kind = ContextClause.REGEX
+                self.pattern = self._compile(literal[2:-1] if literal.endswith('/') else literal[2:])
+                self.bound = ContextClause.REGEX_SCORE
+            else:
+                self.kind = ContextClause.EXACT
+                self.bound = ContextClause.EXACT_SCORE
+            self.ceiling = max(self.bound, ContextClause.EXACT_SCORE)
+        return
+
+    def _compile(self, pattern:str):
+        """
+        Compile a pattern, checking it for catastrophic backtracking (see backtracking).
+        Risky patterns are wrapped in a RegexGuard when Context.REGEX_BUDGET is set.
+        """
+        try:
+            compiled = re.compile(pattern)
+        except re.error:
+            if Context.DEBUG: print(f'WARNING: ContextClause, regex expecting: {pattern}')
+            return None
+        
+        self.risk = ContextClause.backtracking(pattern)
+        if self.risk is None:
+            return compiled
+        if Context.DEBUG: print(f'WARNING: ContextClause, {self.key}={pattern!r} may backtrack catastrophically: {self.risk}')
+        return RegexGuard(pattern, self.risk) if Context.REGEX_BUDGET else compiled
+
+    @staticmethod
+    def backtracking(pattern:str) -> str:
+        """
+        Return why a regex may take exponential (or high polynomial) time to fail, None if it looks safe:
+        a repeat over another variable repeat, like '(a+)+' or '(\\w+\\s?)*', 
+        or a repeat over alternatives that can start with the same character, like '(a|ab)*'.
+        
+        Example:
+        print(ContextClause.backtracking('(x+x+)+y'))  #-> nested repeat '(x+x+)+'
+        """
+        try:
+            return ContextClause._backtracking(sre_parse.parse(pattern), pattern)
+        except (re.error, RecursionError):
+            return None
+
+    @staticmethod
+    def _backtracking(tree, pattern:str) -> str:
+        """ Walk a parsed regex (see backtracking) """
+        c = sre_constants
+        for op, av in tree:
+            if op in (c.MAX_REPEAT, c.MIN_REPEAT):
+                low, high, sub = av
+                if high > 1:
+                    inner = ContextClause._variable_repeat(sub)
+                    if inner > 1 and (high == c.MAXREPEAT or inner == c.MAXREPEAT):
+                        return f'nested repeat in {pattern!r}'
+                    elif high == c.MAXREPEAT and ContextClause._overlapping(sub):
+                        return f'repeat over overlapping alternatives in {pattern!r}'
+                trees = [sub]
+            elif op == c.SUBPATTERN:
+                trees = [av[-1]]
+            elif op == c.BRANCH:
+                trees = av[1]
+            elif op in (c.ASSERT, c.ASSERT_NOT):
+                trees = [av[1]]
+            else:
+                trees = [] #-> literals, classes, and atomic / possessive parts (no backtracking)
+            
+            for sub in trees:
+                reason = ContextClause._backtracking(sub, pattern)
+                if reason:
+                    return reason
+        return None
+
+    @staticmethod
+    def _variable_repeat(tree) -> int:
+        """ Highest max count of the repeats in tree that can match a variable number of times """
+        c = sre_constants
+        highest = 0
+        for op, av in tree:
+            if op in (c.MAX_REPEAT, c.MIN_REPEAT):
+                low, high, sub = av
+                highest = max(highest, high if low != high else 0, ContextClause._variable_repeat(sub))
+            elif op == c.SUBPATTERN:
+                highest = max(highest, ContextClause._variable_repeat(av[-1]))
+            elif op == c.BRANCH:
+                highest = max([highest] + [ContextClause._variable_repeat(sub) for sub in av[1]])
+        return highest
+
+    @staticmethod
+    def _overlapping(tree) -> bool:
+        """ True if a choice in tree has alternatives that can start with the same character """
+        c = sre_constants
+        for op, av in tree:
+            if op == c.SUBPATTERN and ContextClause._overlapping(av[-1]):
+                return True
+            elif op == c.BRANCH:
+                seen = set()
+                for sub in av[1]:
+                    first = ContextClause._first(sub)
+                    if first is None or seen.intersection(first):
+                        return True
+                    seen.update(first)
+        return False
+
+    @staticmethod
+    def _first(tree) -> set:
+        """ Characters tree can start with, None when they are too many to tell (classes, optional parts, ...) """
+        c = sre_constants
+        if not tree:
+            return None
+        op, av = tree[0]
+        if op == c.LITERAL:
+            return {av}
+        elif op == c.IN and all(item_op == c.LITERAL for item_op, _ in av):
+            return {value for _, value in av}
+        elif op == c.SUBPATTERN:
+            return ContextClause._first(av[-1])
+        elif op in (c.MAX_REPEAT, c.MIN_REPEAT) and av[0] > 0:
+            return ContextClause._first(av[2])
+        return None
+
+    def __getstate__(self):
+        """ Pickle patterns by source: they are compiled again on first use, not on load """
+        state = {key : getattr(self, key) for key in ContextClause.__slots__}
+        if state['pattern'] is not None:
+            state['pattern'] = state['pattern'].pattern
+        return state
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+        return
+
+    def score(self, target, folded=None, budget:RegexBudget=None) -> float:
+        """
+        Score this clause against a target value, 0 if it does not match.
+        folded is the already folded target (lowercase), when the caller has it.
+        budget bounds the time of guarded regexes (see RegexGuard).
+        """
+        if not target:
+            return 0
+        
+        kind = self.kind
+        if kind == ContextClause.CONTEXT:
+            return self.sub.match(target, budget=budget)[0] if isinstance(target, Context) else 0
+        elif kind == ContextClause.NONE or not isinstance(target, str):
+            return 0
+        
+        if folded is None:
+            folded = target if Context.CASE_SENSITIVE else target.lower()
+
+        if folded == self.literal:
+            return ContextClause.EXACT_SCORE
+        elif kind == ContextClause.ANY:
+            return ContextClause.ANY_SCORE
+        
+        pattern = self.pattern
+        if pattern.__class__ is str:
+            pattern = self.pattern = self._compile(pattern) #-> restored from a snapshot
+        if pattern is None:
+            return 0
+        elif pattern.__class__ is RegexGuard:
+            matched = pattern.fullmatch(folded, budget)
+        else:
+            matched = pattern.fullmatch(folded)
+        
+        if not matched:
+            return 0
+        elif kind == ContextClause.WILDCARD:
+            return ContextClause.WILDCARD_SCORE + (ContextClause.WILDCARD_SPAN * (self.literal_count / len(folded)))
+        return ContextClause.REGEX_SCORE
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.key!r}, {self.test!r})'
+
+
+class ContextMatcher():
+    """
+    Compiled Context-test: one ContextClause per key, executed in order against a Context-target.
+    Build it through Context.matcher(), which keeps it cached on the Context-test.
+
+    bound/ceiling are the upper limits for the score returned by match (see ContextClause).
+    """
+
+    __slots__ = ('clauses', 'bound', 'ceiling')
+
+    def __init__(self, test:Context):
+        self.clauses = tuple(ContextClause(key, test[key]) for key in test.keys() if key != '..')
+        
+        # Accumulate in the same order as match, so that rounding can never push a score above them
+        self.bound = self.ceiling = 0
+        for clause in self.clauses:
+            self.bound += Context.MAX_CLAUSE + clause.bound
+            self.ceiling += Context.MAX_CLAUSE + clause.ceiling
+        return
+
+    def match(self, target:Context, folded:dict=None, budget:RegexBudget=None):
+        """
+        Return (score, subs) for the Context-target; (0, None) if any clause fails.
+        folded is an optional cache {key : folded value} shared by calls on the same target,
+        budget an optional RegexBudget shared by their guarded regexes (see RegexGuard).
+        """
+        score = 0
+        subs = {}
+        for clause in self.clauses:
+            key = clause.key
+            value = dict.__getitem__(target, key)
+            if folded is not None and isinstance(value, str):
+                if key not in folded:
+                    folded[key] = value if Context.CASE_SENSITIVE else value.lower()
+                clause_score = clause.score(value, folded[key], budget)
+            else:
+                clause_score = clause.score(value, budget=budget)
+
+            # If there was a Context-key-value match, accumulate; otherwise break with fail!
+            if not clause_score:
+                return 0, None
+            subs[key] = value
+            score += Context.MAX_CLAUSE + clause_score
+        return score, subs
 
-            result = re.sub(pattern, substitute, sentence)
-        return result
 
 ###
 ### CONTEXTUALIZED ELEMENT
@@ -333,23 +953,412 @@ class ContextRecord():
         self.namespace : str = goal if goal else Context._
         self.context : Context = condition if isinstance(condition,Context) else Context(condition)
         self.action : list = action
+        self.context.matcher()  #-> compile the condition once, at load time
+        self._template = (action, Context.template(action)) if isinstance(action, str) else None
         return 
 
+    def compile(self) -> str:
+        """
+        Compile the action within the condition Context, reusing the action's parsed template.
+        """
+        if self._template is not None and self._template[0] is self.action:
+            return self.context.render(self._template[1])
+        return self.context.compile(sentence=self.action)
+
     def __hash__(self):
-        result = ''
-        for field in [self.namespace, self.context, self.action]:
-            #result = hash( (result, tuple(field) if field and isinstance(field, Iterable) else '_' ))
-            result = hash((result, field.__hash__)) 
-        return result
+        return self.fingerprint()
+
+    def fingerprint(self) -> int:
+        """
+        Content-based fingerprint of goal({condition})->{action}, so identical records share it.
+        The condition's part is cached by Context.fingerprint.
+        """
+        return ContextRecord.fingerprint_of(self.context, self.action, self.namespace)
+
+    @staticmethod
+    def fingerprint_of(condition, action, goal:str = None) -> int:
+        """
+        Fingerprint of the record that would be built from these parameters, without building (compiling) it.
+        """
+        condition = condition if isinstance(condition, Context) else Context(condition)
+        return Context.digest( (goal if goal else Context._, condition.fingerprint(), action) )
  
     def __repr__(self):
         return f'{self.__class__.__name__}({self.context}, {self.action})'
     
 
+###
+### CONTEXT INDEX
+###
+
+class WildcardAutomaton():
+    """
+    Aho-Corasick automaton over the literal pieces of '*'-wildcard patterns.
+
+    All patterns of one field share the automaton: the target is scanned once, and every
+    pattern whose pieces appear in the right order (honoring a leading/trailing anchor
+    when the pattern does not start/end with '*') is reported.
+    The cost of a scan depends on the length of the target, not on the number of patterns.
+
+    Example:
+    wa = WildcardAutomaton()
+    wa.add('*good*morning*', 'rule-1')
+    wa.add('hello*', 'rule-2')
+    print(wa.scan('good sunny morning'))  #-> ['rule-1']
+    """
+
+    def __init__(self):
+        self._pieces = dict()      # piece -> piece id
+        self._patterns = dict()    # key piece id -> [(pieces, start anchored, end anchored, item)]
+        self._compiled = None      # (goto, fail, out), rebuilt lazily after add()
+        return
+
+    def __len__(self):
+        return sum(len(patterns) for patterns in self._patterns.values())
+
+    def add(self, pattern:str, item):
+        """
+        Register a wildcard pattern (already folded) and the item to report when it is found.
+        """
+        pieces = tuple(piece for piece in pattern.split('*') if piece)
+        if not pieces:
+            raise ValueError(f'WildcardAutomaton.add: pattern has no literal piece, {pattern}')
+
+        ids = tuple((self._pieces.setdefault(piece, len(self._pieces)), len(piece)) for piece in pieces)
+        key = max(ids, key=lambda piece: piece[1])[0]   #-> longest piece is the most selective
+        self._patterns.setdefault(key, []).append((ids, not pattern.startswith('*'), not pattern.endswith('*'), item))
+        self._compiled = None
+        return
+
+    def _build(self):
+        """ Build goto/fail/output tables from the registered pieces """
+        goto, fail, out = [dict()], [0], [()]
+        for piece, piece_id in self._pieces.items():
+            state = 0
+            for ch in piece:
+                if ch not in goto[state]:
+                    goto.append(dict())
+                    fail.append(0)
+                    out.append(())
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            out[state] += (piece_id,)
+
+        # Breadth-first: fail links and inherited outputs
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, child in goto[state].items():
+                link = fail[state]
+                while link and ch not in goto[link]:
+                    link = fail[link]
+                fail[child] = goto[link].get(ch, 0) if state else 0
+                out[child] += out[fail[child]]
+                queue.append(child)
+
+        self._compiled = (goto, fail, out)
+        return self._compiled
+
+    def scan(self, text:str) -> list:
+        """
+        Return the items of every pattern whose pieces occur in text, in order.
+        """
+        goto, fail, out = self._compiled or self._build()
+
+        # (1) One pass over text collecting the end positions of every piece
+        ends = dict()
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for piece_id in out[state]:
+                if piece_id in ends:
+                    ends[piece_id].append(pos)
+                else:
+                    ends[piece_id] = [pos]
+
+        # (2) Check ordering only for patterns whose key piece was seen
+        found = []
+        for key in ends:
+            for ids, at_start, at_end, item in self._patterns.get(key, ()):
+                if WildcardAutomaton._in_order(ids, at_start, at_end, ends, len(text)):
+                    found.append(item)
+        return found
+
+    @staticmethod
+    def _in_order(ids, at_start, at_end, ends, length):
+        """ Greedy check that the pieces occur one after the other without overlapping """
+        pos = 0
+        last = len(ids) - 1
+        for i, (piece_id, size) in enumerate(ids):
+            positions = ends.get(piece_id)
+            if not positions:
+                return False
+            if i == last and at_end:
+                # Last piece must close the text
+                if positions[-1] != length - 1 or length - size < pos:
+                    return False
+                if i == 0 and at_start and size != length:
+                    return False
+            else:
+                j = bisect_left(positions, pos + size - 1)
+                if j == len(positions):
+                    return False
+                if i == 0 and at_start and positions[j] != size - 1:
+                    return False
+                pos = positions[j] + 1
+        return True
+
+
+
+class ContextIndex():
+    """
+    Compiled index of the ContextRecords stored under one namespace of a ContextRepo.
+    
+    Records with an exact-value clause (e.g. {'server_name':'FAU', 'message':'*hello*'}) are filed
+    in a partition per (field, value): an inner ContextIndex for the rest of their condition.
+    A Context-target only visits the partitions for its own values, so rules scoped to other
+    servers, channels or authors are never considered.
+
+    Inside a partition (or when there is no exact clause), each record is filed once, under the most 
+    selective clause of its condition, grouped by the field that clause tests and by the kind of 
+    pattern it uses. A lookup only visits the groups (and the records inside them) that can 
+    actually match the Context-target; the final decision is still taken by Context.match.
+
+    Pattern kinds:
+    EXACT    : 'hello'       -> partition, hash lookup by value
+    PREFIX   : 'hello*'      -> hash lookup by the target's prefix, per indexed length
+    SUFFIX   : '*hello'      -> hash lookup by the target's suffix, per indexed length
+    WILDCARD : '*hello*'     -> WildcardAutomaton, one scan of the target for all patterns
+               'a*b*c'
+    SCAN     : anything else ('*', 'r/regex', sub-contexts, non-str) -> always visited
+
+    Records are also ranked by the highest score they can reach (ContextMatcher.bound), so 
+    ContextIndex.ranked can hand them out best-first and the caller can stop early.
+
+    Example:
+    idx = ContextIndex()
+    idx.add(ContextRecord(condition={'message':'*hello*'}, action='Hi!'))
+    idx.add(ContextRecord(condition={'channel_name':'dev', 'message':'*'}, action='Hi dev!'))
+    for record in idx.candidates(Context({'message':'hello there', 'channel_name':'general'})):
+        print(record)
+    """
+
+    EXACT, PREFIX, SUFFIX, WILDCARD, SCAN = range(5)
+
+    def __init__(self, scoped:frozenset=frozenset()):
+        self._scoped = scoped    # fields already fixed by the enclosing partitions
+        self._seq = 0            # insertion order, to keep results stable
+        self._count = 0
+        self._partitions = dict()# field -> {value : ContextIndex}
+        self._prefix = dict()    # field -> {length : {prefix : [entries]}}
+        self._suffix = dict()    # field -> {length : {suffix : [entries]}}
+        self._wildcard = dict()  # field -> WildcardAutomaton
+        self._scan = list()      # entries that must always be tested, kept sorted
+        self._verbatim = dict()  # field -> {pattern : {seq}}, patterns scoring above bound on equality
+        return
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def classify(test):
+        """
+        Return (kind, literal) for a Context-test value or an already compiled ContextClause.
+        """
+        clause = test if isinstance(test, ContextClause) else ContextClause(None, test)
+        literal = clause.literal
+
+        if clause.kind == ContextClause.EXACT:
+            return ContextIndex.EXACT, literal
+        elif clause.kind != ContextClause.WILDCARD or ContextClause.REGEX_CHARS.intersection(literal):
+            return ContextIndex.SCAN, None
+        
+        stripped = literal.strip('*')
+        if not stripped:
+            return ContextIndex.SCAN, None
+        elif '*' in stripped or (literal.startswith('*') and literal.endswith('*')):
+            return ContextIndex.WILDCARD, literal
+        elif literal.endswith('*'):
+            return ContextIndex.PREFIX, stripped
+        return ContextIndex.SUFFIX, stripped
+
+    def _anchor(self, matcher:ContextMatcher):
+        """
+        Pick the most selective clause (field, kind, literal) of a condition, among the fields not yet scoped.
+        """
+        best = (None, ContextIndex.SCAN, None)
+        for clause in matcher.clauses:
+            if clause.key in self._scoped:
+                continue
+            kind, literal = ContextIndex.classify(clause)
+            if kind < best[1] or (kind == best[1] and kind != ContextIndex.SCAN and len(literal) > len(best[2])):
+                best = (clause.key, kind, literal)
+        return best
+
+    def add(self, record, seq:int=None):
+        """
+        File a ContextRecord in the partition of its first exact clause, or under its anchor clause.
+        Entries are (-bound, seq, record), so sorting them gives best-first, then insertion order.
+        """
+        if seq is None:
+            seq = self._seq
+            self._seq += 1
+        self._count += 1
+
+        matcher = record.context.matcher()
+        field, kind, literal = self._anchor(matcher)
+        if kind == ContextIndex.EXACT:
+            partitions = self._partitions.setdefault(field, dict())
+            if literal not in partitions:
+                partitions[literal] = ContextIndex(scoped=self._scoped | {field})
+            partitions[literal].add(record, seq)
+            return
+        
+        entry = (-matcher.bound, seq, record)
+        for clause in matcher.clauses:
+            if clause.literal is not None and clause.bound < clause.ceiling:
+                self._verbatim.setdefault(clause.key, dict()).setdefault(clause.literal, set()).add(seq)
+
+        if kind == ContextIndex.PREFIX:
+            self._prefix.setdefault(field, dict()).setdefault(len(literal), dict()).setdefault(literal, []).append(entry)
+        elif kind == ContextIndex.SUFFIX:
+            self._suffix.setdefault(field, dict()).setdefault(len(literal), dict()).setdefault(literal, []).append(entry)
+        elif kind == ContextIndex.WILDCARD:
+            if field not in self._wildcard:
+                self._wildcard[field] = WildcardAutomaton()
+            self._wildcard[field].add(literal, entry)
+        else:
+            insort(self._scan, entry)
+        return
+
+    def prepare(self):
+        """
+        Build every lazily compiled structure (wildcard automata), here and in the partitions.
+        """
+        for automaton in self._wildcard.values():
+            automaton._compiled or automaton._build()
+        for partitions in self._partitions.values():
+            for index in partitions.values():
+                index.prepare()
+        return self
+
+    def candidates(self, target:Context, folded:dict=None) -> list:
+        """
+        Return the records that can match the Context-target, in insertion order.
+        folded is an optional cache {key : folded value}, shared with ContextMatcher.match.
+        """
+        found = self._entries(target, dict() if folded is None else folded)
+        found.sort(key=lambda entry: entry[1])
+        return [record for _, _, record in found]
+
+    def ranked(self, target:Context, folded:dict=None):
+        """
+        Iterate over (bound, seq, record) for the records that can match the Context-target, 
+        highest bound first (then insertion order).
+        """
+        for bound, seq, record in self._ranked(target, dict() if folded is None else folded):
+            yield -bound, seq, record
+        return 
+
+    def _ranked(self, target:Context, folded:dict):
+        """ Entries (-bound, seq, record) in ascending order, merged with the visited partitions """
+        found = self._gather(target, folded)
+
+        # Records whose test string equals the target value may score above their bound
+        boosted = set()
+        for field, patterns in self._verbatim.items():
+            value = ContextIndex._value(target, field, folded)
+            if value is not None and value in patterns:
+                boosted |= patterns[value]
+
+        if boosted:
+            found = [(-math.inf, seq, record) if seq in boosted else (bound, seq, record) for bound, seq, record in found + self._scan]
+            found.sort()
+            ranking = iter(found)
+        else:
+            found.sort()
+            ranking = heapq.merge(found, self._scan)
+
+        partitions = self._visit(target, folded)
+        if partitions:
+            ranking = heapq.merge(ranking, *[index._ranked(target, folded) for index in partitions])
+        return ranking
+
+    def _entries(self, target:Context, folded:dict) -> list:
+        """ All entries that can match the Context-target, unsorted """
+        found = self._gather(target, folded) + self._scan
+        for index in self._visit(target, folded):
+            found.extend(index._entries(target, folded))
+        return found
+
+    def _visit(self, target:Context, folded:dict) -> list:
+        """ Partitions matching the values of the Context-target """
+        found = []
+        for field, partitions in self._partitions.items():
+            value = ContextIndex._value(target, field, folded)
+            if value is not None and value in partitions:
+                found.append(partitions[value])
+        return found
+
+    def _gather(self, target:Context, folded:dict) -> list:
+        """ Collect the entries from the indexed groups (all but SCAN and partitions) """
+        found = []
+
+        for field, lengths in self._prefix.items():
+            value = ContextIndex._value(target, field, folded)
+            if value is not None:
+                for length, prefixes in lengths.items():
+                    records = prefixes.get(value[:length])
+                    if records: found.extend(records)
+
+        for field, lengths in self._suffix.items():
+            value = ContextIndex._value(target, field, folded)
+            if value is not None:
+                for length, suffixes in lengths.items():
+                    records = suffixes.get(value[-length:])
+                    if records: found.extend(records)
+
+        for field, automaton in self._wildcard.items():
+            value = ContextIndex._value(target, field, folded)
+            if value is not None:
+                found.extend(automaton.scan(value))
+        return found
+
+    @staticmethod
+    def _value(target:Context, field, folded:dict):
+        """ Folded string value of a target field, or None if no string-clause could match it """
+        value = dict.__getitem__(target, field)
+        if not value or not isinstance(value, str):
+            return None
+        if field not in folded:
+            folded[field] = value if Context.CASE_SENSITIVE else value.lower()
+        return folded[field]
+
+
 ###
 ### CONTEXTUALIZED REPO
 ###
 
+class MatchResult(NamedTuple):
+    """
+    Immutable outcome of ContextRepo.match.
+
+    score        : highest matching score (0 if nothing matched)
+    result       : compiled action picked among the records sharing the highest score
+    alternatives : compiled actions sharing the highest score (only when asked for, see ContextRepo.match)
+    matching     : every (record, score) evaluated and matched, highest score first;
+                   records that could not reach the highest score are never evaluated
+    """
+    score: float = 0
+    result: object = None
+    alternatives: tuple = ()
+    matching: tuple = ()
+
+    def __bool__(self):
+        return bool(self.result)
+
+
 class ContextRepo():
     """
     Store of Contextualized Records.
@@ -365,15 +1374,27 @@ class ContextRepo():
     if s in cr:
         print(s.result)
 
+    # Or, without changing s (safe to call from several threads):
+    print(cr.match(s).result)
+
     """
     def __init__(self, valid_class=ContextRecord):
         self.valid_class = valid_class
         self._length = 0
         self._repo = dict()
+        self._index = dict()
         return 
    
+    SNAPSHOT_MAGIC = b'OWLSNAP\n'
+    SNAPSHOT_VERSION = 2
+
     def __len__(self):
         return self._length
+
+    def __iter__(self):
+        """ Iterate over every stored record, namespace by namespace """
+        for records in self._repo.values():
+            yield from records.values()
     
     def __iadd__(self, obj):
         """
@@ -392,9 +1413,11 @@ class ContextRepo():
         
         if namespace not in self._repo:
             self._repo[namespace] = dict()
+            self._index[namespace] = ContextIndex()
 
         if obj_hash not in self._repo[namespace]:
             self._repo[namespace][obj_hash] = obj
+            self._index[namespace].add(obj)
             self._length+=1
         else:
             if Context.DEBUG: print(f'ContextRepo.__iadd__: obj already in the store {self.__class__.__name__}, {self._repo[namespace][obj_hash]}')
@@ -406,50 +1429,170 @@ class ContextRepo():
         """
         return self._repo[namespace].values() if namespace in self._repo else None 
 
-    def __contains__(self, test:Context):
+    def get(self, fingerprint:int, namespace:str = None):
+        """
+        Retrieve the Contextualized Record with this fingerprint (see ContextRecord.fingerprint), if stored
+        """
+        return self._repo.get(namespace or Context._, {}).get(fingerprint)
+
+    def risky(self) -> list:
+        """
+        List the regex clauses flagged for catastrophic backtracking (see ContextClause.backtracking),
+        as (record, key, risk, overruns); overruns counts the matches that blew their time budget (see RegexGuard).
+        """
+        def clauses(matcher):
+            for clause in matcher.clauses:
+                if clause.sub is not None:
+                    yield from clauses(clause.sub)
+                elif clause.risk:
+                    yield clause
+
+        return [(record, clause.key, clause.risk, getattr(clause.pattern, 'overruns', 0))
+                for record in self for clause in clauses(record.context.matcher())]
+
+    ##
+    ## SNAPSHOTS
+    ##
+
+    @staticmethod
+    def _snapshot_header(source:str=None) -> dict:
+        """ Header identifying the code that can read a snapshot (and the source it was built from) """
+        return {'snapshot'  : ContextRepo.SNAPSHOT_VERSION,
+                'context'   : Context.VERSION,
+                'python'    : '%d.%d' % sys.version_info[:2],
+                'source'    : source}
+
+    def snapshot(self, file_name:str, source:str=None):
+        """
+        Write the compiled repo (records, compiled conditions, parsed templates and indexes) to a binary snapshot.
+        source is an opaque tag of the data it was built from (e.g. a digest of the rule file), checked by restore.
+
+        Layout: SNAPSHOT_MAGIC, one JSON header line, pickled payload.
+        The file is written aside and moved in place, so readers never see a partial snapshot.
+        """
+        for index in self._index.values():
+            index.prepare()
+
+        header = json.dumps(self._snapshot_header(source)).encode('utf-8')
+        temp_name = f'{file_name}.{os.getpid()}.tmp'
+        try:
+            with open(temp_name, mode='wb') as file:
+                file.write(ContextRepo.SNAPSHOT_MAGIC + header + b'\n')
+                pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_name, file_name)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+        return
+
+    @classmethod
+    def restore(cls, file_name:str, source:str=None):
+        """
+        Load a repo written by snapshot with a single read; returns None when the file is missing, 
+        unreadable, or was written by another version / from another source (so the caller rebuilds it).
+        
+        Snapshots are pickles: only load files written by this process' owner.
+        """
+        try:
+            with open(file_name, mode='rb') as file:
+                data = memoryview(file.read())
+        except OSError:
+            return None
+
+        magic = len(ContextRepo.SNAPSHOT_MAGIC)
+        end = bytes(data[:4096]).find(b'\n', magic)
+        if data[:magic] != ContextRepo.SNAPSHOT_MAGIC or end < 0:
+            if Context.DEBUG: print(f'ContextRepo.restore: not a snapshot, {file_name}')
+            return None
+
+        try:
+            header = json.loads(bytes(data[magic:end]))
+        except ValueError:
+            return None
+        if header != cls._snapshot_header(source):
+            if Context.DEBUG: print(f'ContextRepo.restore: stale snapshot {file_name}, {header}')
+            return None
+
+        try:
+            repo = pickle.loads(data[end+1:])
+        except Exception as e:
+            if Context.DEBUG: print(f'ContextRepo.restore: cannot read {file_name}, {e}')
+            return None
+        return repo if isinstance(repo, cls) else None
+
+    def match(self, test:Context, alternatives:bool=False) -> MatchResult:
         """
         Matches a Context-test against selected ContextRecords in ContextRepo.
         Context-test.namespace will narrow the search space for given 'namespace'.
+        Only the picked action is compiled, unless alternatives=True asks for every highest-score action.
+        Regexes flagged as catastrophic-backtracking share one Context.REGEX_BUDGET for the whole match
+        (see RegexGuard): once it is spent, the remaining ones fail without running.
+
+        Nothing is written to the Context-test nor to the stored records, so the same
+        ContextRepo can be matched concurrently from several threads.
         """
 
         # CUT-SHORT conditions
         if test is None:
-            return None
-        elif not (isinstance(test, Context) or isinstance(test, str)):
-            raise ValueError(f"ContextRepo.__contains__: expected Context or str, got {type(test)}")
+            return MatchResult()
+        elif not isinstance(test, Context):
+            raise ValueError(f"ContextRepo.match: expected Context, got {type(test)}")
 
         # PROCESSING
         matching_plans = []
         namespace = test.namespace or Context._
-
-        # @NOTE:
-        # This logic needs to be improved; we should be storing already sorted by 'potential match score' and 
-        # going through highest-score(s) only, not the whole list!
-        #
-        # Check every record inside _repo[namespace]
-        if namespace in self._repo:
-            for record in self._repo[namespace].values():
-                ## @NOTE
-                # Does record.context (test) matches the target?
-                # If so, record.context was loaded with:
-                #       record.context.score : matching score
-                if record.context in test:
-                    test.result = record.context.compile(sentence=record.action)
-                    test.score = record.context.score
-                    matching_plans.append( (test.result, test.score) )
-
-        # Initialize and load results
-        test.score = 0
-        test.matching = test.alternatives = test.result = None
+        index = self._index.get(namespace)
+        folded = dict()
+        budget = RegexBudget(Context.REGEX_BUDGET) if Context.REGEX_BUDGET else None #-> for all the guarded regexes
+
+        # Best-first over the records the index says can match: 
+        # stop as soon as no remaining record can reach (or tie) the best score so far
+        if index is not None:
+            best = 0
+            for bound, seq, record in index.ranked(test, folded):
+                if bound < best:
+                    break
+                score, _ = record.context.matcher().match(test, folded, budget)
+                if score:
+                    matching_plans.append( (score, seq, record) )
+                    best = max(best, score)
+
+        if not matching_plans:
+            return MatchResult()
+
+        matching_plans.sort(key=lambda x: (-x[0], x[1]))
+        score = matching_plans[0][0]
+        top = [record for plan_score, _, record in matching_plans if plan_score == score] # records with highest-score
+        picked = random.choice(top) # pick one alternative
+        result = picked.compile()
         
-        if len(matching_plans):
-            matching_plans.sort(key=lambda x: x[1], reverse=True)  
-            test.score = matching_plans[0][1] 
-            test.matching = matching_plans
-            test.alternatives = [plan[0] for plan in matching_plans if plan[1] == test.score] # alternatives with highest-score
-            test.result = random.choice(test.alternatives) # pick one alternative
+        if alternatives:
+            alternatives = tuple(result if record is picked else record.compile() for record in top)
+        return MatchResult(score=score, 
+                           result=result,
+                           alternatives=alternatives or (), 
+                           matching=tuple( (record, plan_score) for plan_score, _, record in matching_plans ))
+
+    def __contains__(self, test:Context):
+        """
+        Compatibility wrapper around ContextRepo.match, loading the results into the Context-test:
+            test.score, test.result, test.alternatives, test.matching (as (record, score))
+        """
+
+        # CUT-SHORT conditions
+        if test is None:
+            return None
+        elif not (isinstance(test, Context) or isinstance(test, str)):
+            raise ValueError(f"ContextRepo.__contains__: expected Context or str, got {type(test)}")
 
-        return bool(test.result)
+        result = self.match(test, alternatives=True)
+        test.score = result.score
+        test.matching = test.alternatives = test.result = None
+        if result.matching:
+            test.matching = list(result.matching)
+            test.alternatives = list(result.alternatives)
+            test.result = result.result
+        return bool(result)
 
     def __repr__(self):
         """ Return string representation """
@@ -465,6 +1608,7 @@ class ContextRepo():
         """ Remove all items from the repository """
         self._length = 0
         self._repo.clear()
+        self._index.clear()
         return 
 
 ###
@@ -23,10 +23,32 @@
 # 
 
 import re
+import asyncio
+import time
 import discord
-import datetime
 from .bot import BotMessage, BotEngine
 
+class DiscordMessage(BotMessage):
+    """
+    BotMessage backed by the original discord.Message (in 'source').
+    Server, channel, thread and author names, IDs, attachments and reactions are DERIVED:
+    they are read from Discord objects the first time they are needed.
+    """
+    DERIVED = dict(BotMessage.DERIVED,
+        layer1          = lambda m: m.source.guild.id if m.source.guild else 0,
+        layer2          = lambda m: m.source.channel.id if hasattr(m.source.channel, 'id') else 0,
+        layer3          = lambda m: m.source.channel.id if isinstance(m.source.channel, discord.Thread) else 0,
+        layer4          = lambda m: m.source.author.id,
+        server_name     = lambda m: m.source.guild.name if m.source.guild else '#dm',
+        channel_name    = lambda m: m.source.channel.name if hasattr(m.source.channel, 'name') else '#dm',
+        thread_name     = lambda m: m.source.channel.name if isinstance(m.source.channel, discord.Thread) else '',
+        author_name     = lambda m: m.source.author.name,
+        author_fullname = lambda m: m.source.author.global_name,
+        author          = lambda m: m.source.author.global_name,
+        attachments     = lambda m: [attachment.url for attachment in m.source.attachments],
+        reactions       = lambda m: [str(reaction.emoji) for reaction in m.source.reactions])
+
+
 class DiscordBot(discord.Client):
     """
     DiscordBot provides logic to connect the Discord Runner with OwlMind's BotMind, 
@@ -40,13 +62,27 @@ class DiscordBot(discord.Client):
     TOKEN = {My Token}
     bot = DiscordBot(token=TOKEN, engine=MyBotMind, debug=True)
     bot.run()
+
+    With streaming=True, model answers are posted as a placeholder edited as the text arrives
+    (at most once every EDIT_INTERVAL seconds, to stay within Discord's rate limits).
+
+    Once connected, the engine's model_provider (if any) is warmed up, and kept warm if it has a ping_interval;
+    close() closes its connections.
     """
-    def __init__(self, token, engine:BotEngine, promiscuous:bool=False, debug:bool=False):
+    PLACEHOLDER = '...'
+    EDIT_INTERVAL = 1.0
+    MAX_LENGTH = 2000   # Discord message limit
+
+    def __init__(self, token, engine:BotEngine, promiscuous:bool=False, debug:bool=False, streaming:bool=False):
         self.token = token
         self.promiscuous = promiscuous
         self.debug = debug
+        self.streaming = streaming
         self.engine = engine
-        if self.engine: self.engine.debug = debug
+        self.keep_warm = None   # asyncio.Task pinging the model provider
+        if self.engine: 
+            self.engine.debug = debug
+            self.engine.streaming = streaming
 
         ## Discord attributes
         intents = discord.Intents.default()
@@ -66,6 +102,30 @@ class DiscordBot(discord.Client):
             print(f'Bot is connected to {self.engine.__class__.__name__}({self.engine.id}).') 
             if self.engine.announcement: print(self.engine.announcement)
             self.engine.debug = self.debug
+            await self.warm_up()
+
+    async def warm_up(self):
+        """ Load the model before the first prompt, then keep it loaded (once, although on_ready runs on every reconnection) """
+        provider = getattr(self.engine, 'model_provider', None)
+        if provider is None or not hasattr(provider, 'awarm_up'):
+            return
+        if self.keep_warm is None:
+            started = time.time()
+            ready = await provider.awarm_up()
+            print(f'Model {provider.model} @ {provider.base_url}: ' + (f'warmed up in {time.time() - started:.1f}s.' if ready else 'WARNING, warm-up failed.'))
+            self.keep_warm = asyncio.create_task(provider.keep_warm())
+        return
+        
+    async def close(self):
+        """ Stop pinging the model provider and close its connections, then disconnect from Discord """
+        if self.keep_warm is not None:
+            self.keep_warm.cancel()
+            self.keep_warm = None
+        provider = getattr(self.engine, 'model_provider', None)
+        if provider is not None and hasattr(provider, 'aclose'):
+            await provider.aclose()
+        await super().close()
+        return
         
     async def on_message(self, message):
         # CUT-SHORT conditions
@@ -78,41 +138,48 @@ class DiscordBot(discord.Client):
         # Remove calling @Mention if in the message
         text = re.sub(r"<@\d+>", "", message.content,).strip()
 
-        # Collect attachments, reactions and others.
-        attachments = [attachment.url for attachment in message.attachments]
-        reactions = [str(reaction.emoji) for reaction in message.reactions]
-
-        # Create context
-        context = BotMessage(
-                layer1       = message.guild.id if message.guild else 0,
-                layer2       = message.channel.id if hasattr(message.channel, 'id') else 0,
-                layer3       = message.channel.id if isinstance(message.channel, discord.Thread) else 0,
-                layer4       = message.author.id,
-                server_name  = message.guild.name if message.guild else '#dm',
-                channel_name    = message.channel.name if hasattr(message.channel, 'name') else '#dm',
-                thread_name     = message.channel.name if isinstance(message.channel, discord.Thread) else '',
-                author_name     = message.author.name,
-                author_fullname = message.author.global_name,
-                author          = message.author.global_name,
-                bot             = self.user,
-                timestamp=datetime.datetime.now(),
-                date=datetime.datetime.now().strftime("%d-%b-%Y"),  # Format date as '25-Feb-2024'
-                time=datetime.datetime.now().strftime("%H:%M:%S"),  # Format time as '20:58:14'
-                message         = text,
-                attachments     = attachments,
-                reactions       = reactions)
+        # Create context; the other Discord fields are read only if a rule or template needs them
+        context = DiscordMessage(message, bot=self.user, message=text)
 
         if self.debug: print(f'PROCESSING: ctx={context}')
                                
-        # Process through engine
+        # Process through engine, without blocking other Discord events while it waits for a Model Provider
         if self.engine:
-            self.engine.process(context)
+            await self.engine.aprocess(context)
 
         # If the immediate processing of Context generated a result (sync mode), return it through the bot interface
         # @TODO return attachments, issue reactions, etc
-        if context.response:
+        if context.stream is not None:
+            context.response = await self.send_stream(message.channel, context.stream)
+        elif context.response:
             await message.channel.send(context.response)
         return
 
+    async def send_stream(self, channel, stream) -> str:
+        """
+        Post a placeholder and edit it with the text from an async stream: right away for the first piece,
+        then at most once every EDIT_INTERVAL seconds; text beyond MAX_LENGTH continues in a new message.
+        Returns the whole text.
+        """
+        message = await channel.send(DiscordBot.PLACEHOLDER)
+        parts, text, shown, last_edit = [], '', DiscordBot.PLACEHOLDER, 0.0
+        async for chunk in stream:
+            parts.append(chunk)
+            text += chunk
+            while len(text) > DiscordBot.MAX_LENGTH:
+                await message.edit(content=text[:DiscordBot.MAX_LENGTH])
+                text = text[DiscordBot.MAX_LENGTH:]
+                message = await channel.send(text)
+                shown, last_edit = text, time.monotonic()
+            if text.strip() and text != shown and time.monotonic() - last_edit >= DiscordBot.EDIT_INTERVAL:
+                await message.edit(content=text)
+                shown, last_edit = text, time.monotonic()
+
+        if not parts:
+            text = "!!ERROR!! There was no response (?)"
+        if text != shown:
+            await message.edit(content=text)
+        return ''.join(parts)
+
     def run(self):
         super().run(self.token)
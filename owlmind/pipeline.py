@@ -23,10 +23,24 @@
 # Generative AI has been used extensively while developing this package.
 # 
 
+import asyncio
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from urllib.parse import urljoin
 import time
+import sqlite3
+import threading
+from hashlib import blake2b
+import math
+import heapq
+import weakref
+import itertools
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 
 class ModelRequestMaker():
@@ -43,17 +57,31 @@ class ModelRequestMaker():
     def unpackage(self, response):
         raise(f'!!ERROR!! unpackage() must be overload')
 
+    def unpackage_chunk(self, line):
+        raise NotImplementedError('unpackage_chunk() must be overloaded')
+
+    def unpackage_models(self, response):
+        raise NotImplementedError('unpackage_models() must be overloaded')
+
+    def warm_up(self, model, keep_alive=None):
+        raise NotImplementedError('warm_up() must be overloaded')
+
 class OllamaRequest(ModelRequestMaker):
     
+    def url_models(self, url):
+        return urljoin(url, '/api/tags')
+
     def url_chat(self, url):
         return urljoin(url, '/api/generate')
     
-    def package(self, model, prompt, **kwargs):
+    def package(self, model, prompt, stream=False, keep_alive=None, **kwargs):
         payload = {
             "model": model, 
             "prompt": prompt, 
-            "stream": False,
+            "stream": stream,
         }
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
 
         # Load kwargs into payload.options
         if kwargs:
@@ -63,16 +91,36 @@ class OllamaRequest(ModelRequestMaker):
     def unpackage(self, response):
         return response['response'] if 'response' in response else None
 
+    def unpackage_chunk(self, line):
+        """ Text of one line of the NDJSON stream """
+        line = line.strip()
+        return json.loads(line).get('response') if line else None
+
+    def unpackage_models(self, response):
+        return [model['name'] for model in response.get('models', [])]
+
+    def warm_up(self, model, keep_alive=None):
+        """ A generate request with no prompt only loads the model (and sets how long it stays loaded) """
+        payload = {"model": model}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
 
 class OpenWebUIRequest(ModelRequestMaker):
+    def url_models(self, url):
+        return urljoin(url, '/api/models')
+
     def url_chat(self, url):
         return urljoin(url, '/api/chat/completions')
     
-    def package(self, model, prompt, **kwargs):
+    def package(self, model, prompt, stream=False, **kwargs):
         payload = {
             "model": model if model else self.model, 
             "messages": [ {"role" : "user", "content": prompt } ]
         }
+        if stream:
+            payload["stream"] = True
 
         # @NOTE: Need to find out the right syntax to load the arguments here!
         #kwargs = {key: value for key, value in self.__dict__}
@@ -83,13 +131,499 @@ class OpenWebUIRequest(ModelRequestMaker):
     def unpackage(self, response):
         return response['choices'][0]['message']['content'] if 'choices' in response else None
 
+    def unpackage_chunk(self, line):
+        """ Text of one line of the Server-Sent Events stream ('data: {...}', until 'data: [DONE]') """
+        line = line.strip()
+        if not line.startswith('data:') or line[5:].strip() == '[DONE]':
+            return None
+        choices = json.loads(line[5:]).get('choices') or [dict()]
+        return (choices[0].get('delta') or dict()).get('content')
+
+    def unpackage_models(self, response):
+        return [model['id'] for model in response.get('data', [])]
+
+    def warm_up(self, model, keep_alive=None):
+        """ The shortest completion: there is no load-only request (nor keep_alive) through Open WebUI """
+        return {"model": model, "messages": [ {"role" : "user", "content": "ping"} ], "max_tokens": 1}
+
+
+###
+### RESPONSE CACHE
+###
+
+class ResponseCache():
+    """
+    Cache of Model Provider responses, keyed by (provider type, model, options, normalized prompt).
+
+    Responses are kept in memory, up to 'maxsize' entries (least recently used are dropped first) and
+    for 'ttl' seconds (None keeps them until dropped). With a 'path', they are also written to an
+    SQLite file, which survives restarts and refills memory on a miss. The file keeps up to 'maxrows'
+    responses (the oldest written are dropped first); expired ones are purged as new ones are written.
+    'hits', 'disk_hits' (included in hits) and 'misses' count the lookups.
+
+    get/put touch the file on the calling thread; aget/aput do it in a worker thread, off the event loop.
+
+    Example:
+    provider = ModelProvider(base_url=URL, type='ollama', model='llama3', cache=ResponseCache(ttl=3600, path='responses.db'))
+    provider.request('What is OwlMind?')   #-> asks the model
+    provider.request('what is  OwlMind? ') #-> from the cache
+    """
+    MAXROWS = 100000
+    PURGE_EVERY = 64    # writes between two purges of the file
+
+    def __init__(self, maxsize:int=1024, ttl:float=3600, path:str=None, maxrows:int=MAXROWS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxrows = maxrows
+        self.hits = self.disk_hits = self.misses = 0
+        self._memory = OrderedDict() # key -> (expires, response)
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        self._writes = 0
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            with self._disk:
+                self._disk.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL, response TEXT)')
+                self._disk.execute('CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)')
+            self._purge()
+        return
+
+    def __len__(self):
+        return len(self._memory)
+
+    @staticmethod
+    def key(type, model, prompt:str, options:dict=None) -> str:
+        """
+        Cache key of a prompt: case and runs of whitespace in the prompt do not matter
+        """
+        prompt = ' '.join(prompt.split()).lower()
+        return blake2b(json.dumps([type, model, sorted((options or dict()).items()), prompt], default=str).encode('utf-8'), 
+                       digest_size=16).hexdigest()
+
+    def get(self, key:str) -> str:
+        """
+        Return the cached response, or None
+        """
+        now = time.time()
+        result = self._recall(key, now)
+        if result is None and self._disk is not None:
+            result = self._read(key, now)
+        if result is None:
+            self._miss()
+        return result
+
+    async def aget(self, key:str) -> str:
+        """
+        Same as get, reading the file in a worker thread
+        """
+        now = time.time()
+        result = self._recall(key, now)
+        if result is None and self._disk is not None:
+            result = await asyncio.to_thread(self._read, key, now)
+        if result is None:
+            self._miss()
+        return result
+
+    def put(self, key:str, response:str):
+        """
+        Cache a response
+        """
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._remember(key, expires, response)
+        if self._disk is not None:
+            self._write(key, expires, response)
+        return
+
+    async def aput(self, key:str, response:str):
+        """
+        Same as put, writing the file in a worker thread
+        """
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._remember(key, expires, response)
+        if self._disk is not None:
+            await asyncio.to_thread(self._write, key, expires, response)
+        return
+
+    def _recall(self, key, now):
+        """ The response in memory, or None """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            elif entry is not None:
+                del self._memory[key]
+        return None
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        return
+
+    def _read(self, key, now):
+        """ The response in the file (kept in memory again), or None """
+        with self._disk_lock:
+            row = self._disk.execute('SELECT expires, response FROM responses WHERE key = ?', (key,)).fetchone()
+        if not row or (row[0] is not None and row[0] <= now):
+            return None
+        with self._lock:
+            self._remember(key, row[0], row[1])
+            self.hits += 1
+            self.disk_hits += 1
+        return row[1]
+
+    def _write(self, key, expires, response):
+        """ Write a response to the file, purging it every PURGE_EVERY writes """
+        with self._disk_lock:
+            with self._disk:
+                self._disk.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)', (key, expires, response))
+            self._writes += 1
+            purge = self._writes % ResponseCache.PURGE_EVERY == 0
+        if purge:
+            self._purge()
+        return
+
+    def _purge(self):
+        """ Drop the expired responses from the file, then the oldest written beyond maxrows """
+        with self._disk_lock:
+            with self._disk:
+                self._disk.execute('DELETE FROM responses WHERE expires < ?', (time.time(),))
+                if self.maxrows is not None:
+                    self._disk.execute('DELETE FROM responses WHERE rowid <= (SELECT rowid FROM responses ORDER BY rowid DESC LIMIT 1 OFFSET ?)',
+                                       (self.maxrows,))
+        return
+
+    def _remember(self, key, expires, response):
+        """ Keep a response in memory, dropping the least recently used ones beyond maxsize (under the lock) """
+        self._memory[key] = (expires, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+        return
+
+    def clear(self):
+        """
+        Drop every cached response, in memory and on disk
+        """
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            with self._disk_lock:
+                with self._disk:
+                    self._disk.execute('DELETE FROM responses')
+        return
+
+    def stats(self) -> dict:
+        return {'size': len(self._memory), 'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(maxsize={self.maxsize}, ttl={self.ttl})[{self.stats()}]'
+
+
+###
+### REQUEST COALESCING
+###
+
+class SingleFlight():
+    """
+    Identical requests in flight (same key, see ResponseCache.key) share the call of the first one:
+    call() for threads, acall() for event loops; 'coalesced' counts the calls saved.
+    Used by each layer that dispatches prompts (ModelProvider, ProviderPool, AdmissionControl), 
+    so duplicates are caught before they reach a backend, a pool member or an admission slot.
+
+    Example:
+    flight = SingleFlight()
+    result = flight.call(key, provider._request, key, prompt)
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._inflight = dict()     # key -> Future, for call()
+        self._ainflight = dict()    # key -> asyncio.Task, for acall()
+        self._lock = threading.Lock()
+        return
+
+    def __len__(self):
+        return len(self._inflight) + len(self._ainflight)
+
+    def call(self, key, function, *args, **kwargs):
+        """
+        Return function(*args, **kwargs), or the result of the identical call already in flight
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        
+        try:
+            result = function(*args, **kwargs)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return result
+
+    async def acall(self, key, function, *args, **kwargs):
+        """
+        Same as call, awaiting the coroutine function(*args, **kwargs)
+        """
+        # One task per key: callers await it shielded, so a cancelled caller does not cancel the others
+        task = self._ainflight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            self.coalesced += 1
+        else:
+            task = self._ainflight[key] = asyncio.ensure_future(function(*args, **kwargs))
+            task.add_done_callback(lambda done: self._ainflight.pop(key, None) if self._ainflight.get(key) is done else None)
+        return await asyncio.shield(task)
+
+
+###
+### METRICS
+###
+
+class Metrics():
+    """
+    Counters and histograms of the model pipeline, exported as Prometheus text (export, serve) or a summary (summary).
+
+    Collection is lock-free: each thread updates its own shard of plain dicts, and export adds the shards up.
+    Every ModelProvider reports here (Metrics.DEFAULT, unless given its own), labelled by type, model and provider URL:
+        owlmind_model_requests_total{status}    : requests by HTTP status ('timeout' and 'error' when there was none)
+        owlmind_model_request_seconds           : latency of whole requests
+        owlmind_model_ttfb_seconds              : time to the response headers (to the first piece, for streams)
+        owlmind_model_request_bytes, owlmind_model_response_bytes : payload sizes
+        owlmind_model_cache_total{result}       : ResponseCache hits and misses
+        owlmind_model_coalesced_total           : requests answered by an identical one in flight
+
+    Example:
+    Metrics.DEFAULT.serve(port=9464)            #-> curl http://127.0.0.1:9464/metrics
+    print(Metrics.DEFAULT.summary())
+    """
+    PREFIX = 'owlmind_model_'
+    SECONDS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+    BYTES = (256, 1024, 4096, 16384, 65536, 262144, math.inf)
+
+    HELP = {
+        'requests_total'    : ('counter', 'Model requests by HTTP status'),
+        'request_seconds'   : ('histogram', 'Latency of model requests'),
+        'ttfb_seconds'      : ('histogram', 'Time to first byte of model responses'),
+        'request_bytes'     : ('histogram', 'Size of model request payloads'),
+        'response_bytes'    : ('histogram', 'Size of model responses'),
+        'cache_total'       : ('counter', 'Response cache lookups'),
+        'coalesced_total'   : ('counter', 'Requests coalesced with an identical one in flight'),
+    }
+
+    def __init__(self):
+        self.providers = weakref.WeakSet()  # providers whose caches and coalescing are reported
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()       # only taken for a thread's first update
+        return
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = dict()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name:str, labels:tuple, value=1):
+        """
+        Add to a counter; labels is a tuple of (label, value) pairs
+        """
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+        return
+
+    def observe(self, name:str, labels:tuple, value:float, buckets:tuple=SECONDS):
+        """
+        Add a value to a histogram; labels is a tuple of (label, value) pairs
+        """
+        shard = self._shard()
+        key = (name, labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            histogram = shard[key] = [buckets] + [0] * len(buckets) + [0, 0]   #-> buckets, counts..., sum, count
+        histogram[1 + bisect_left(buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+        return
+
+    def collect(self) -> dict:
+        """
+        Add up the shards: {(name, labels) : counter value or [buckets, counts..., sum, count]}
+        """
+        with self._lock:
+            shards = list(self._shards)
+        totals = dict()
+        for shard in shards:
+            for key, value in shard.copy().items():
+                if isinstance(value, list):
+                    total = totals.setdefault(key, [value[0]] + [0] * (len(value) - 1))
+                    for i in range(1, len(value)):
+                        total[i] += value[i]
+                else:
+                    totals[key] = totals.get(key, 0) + value
+
+        caches = set()
+        for provider in list(self.providers):
+            labels = provider.labels()
+            if provider.coalesced:
+                totals[('coalesced_total', labels)] = provider.coalesced
+            if provider.cache is not None and id(provider.cache) not in caches:
+                caches.add(id(provider.cache))
+                totals[('cache_total', labels + (('result', 'hit'),))] = provider.cache.hits
+                totals[('cache_total', labels + (('result', 'miss'),))] = provider.cache.misses
+        return totals
+
+    def export(self) -> str:
+        """
+        Prometheus text exposition of every metric
+        """
+        def series(name, labels, extra=()):
+            escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs = ','.join(f'{label}="{escape(value)}"' for label, value in labels + extra)
+            return f'{Metrics.PREFIX}{name}{{{pairs}}}' if pairs else f'{Metrics.PREFIX}{name}'
+        
+        lines = []
+        totals = self.collect()
+        for name in sorted({name for name, _ in totals}):
+            kind, text = Metrics.HELP.get(name, ('untyped', name))
+            lines.append(f'# HELP {Metrics.PREFIX}{name} {text}')
+            lines.append(f'# TYPE {Metrics.PREFIX}{name} {kind}')
+            for (key, labels), value in sorted(totals.items(), key=lambda item: (item[0][0], item[0][1])):
+                if key != name:
+                    continue
+                if not isinstance(value, list):
+                    lines.append(f'{series(name, labels)} {value}')
+                    continue
+                buckets, counts, total, count = value[0], value[1:-2], value[-2], value[-1]
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{series(name + "_bucket", labels, (("le", "+Inf" if bound == math.inf else bound),))} {cumulative}')
+                lines.append(f'{series(name + "_sum", labels)} {round(total, 6)}')
+                lines.append(f'{series(name + "_count", labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def quantile(histogram:list, q:float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile of a histogram (see collect)
+        """
+        buckets, counts, count = histogram[0], histogram[1:-2], histogram[-1]
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            if count and cumulative >= q * count:
+                return bound
+        return None
+
+    def summary(self) -> str:
+        """
+        One line per provider/model: requests, errors, latency and time-to-first-byte percentiles, cache hit rate
+        """
+        totals = self.collect()
+        groups = sorted({labels for (name, labels) in totals if name == 'request_seconds'})
+        lines = []
+        for labels in groups:
+            requests = {dict(key_labels)['status'] : value for (name, key_labels), value in totals.items() 
+                        if name == 'requests_total' and key_labels[:len(labels)] == labels}
+            errors = sum(value for status, value in requests.items() if status != '200')
+            latency = totals[('request_seconds', labels)]
+            ttfb = totals.get(('ttfb_seconds', labels))
+            line = f'* {dict(labels)["model"]} @ {dict(labels)["provider"]}: {sum(requests.values())} requests, {errors} errors'
+            line += f', latency p50<={Metrics.quantile(latency, 0.5)}s p95<={Metrics.quantile(latency, 0.95)}s'
+            if ttfb:
+                line += f', ttfb p50<={Metrics.quantile(ttfb, 0.5)}s'
+            hits, misses = totals.get(('cache_total', labels + (('result', 'hit'),)), 0), totals.get(('cache_total', labels + (('result', 'miss'),)), 0)
+            if hits + misses:
+                line += f', cache hit rate {hits / (hits + misses):.0%}'
+            lines.append(line)
+        return '\n'.join(lines) if lines else '* no model requests yet'
+
+    def serve(self, port:int=9464, host:str='127.0.0.1') -> ThreadingHTTPServer:
+        """
+        Serve export() on http://host:port/metrics from a daemon thread; returns the server (stop it with shutdown())
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.export().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='owlmind-metrics', daemon=True).start()
+        return server
+
+Metrics.DEFAULT = Metrics()
+
 
 ###
 ### MODEL PROVIDER
 ### 
 
 class ModelProvider():
-    def __init__(self, base_url, type=None, api_key=None, model=None):
+    """
+    Client for a Model Provider (Ollama, Open WebUI).
+
+    Requests go through one long-lived requests.Session per provider: connections are kept alive
+    and reused from a pool of up to 'pool_size' connections per host, and headers are built once.
+    Every request is bounded by 'connect_timeout' (to open a connection) and 'read_timeout'
+    (between bytes of the response), in seconds; None waits forever.
+
+    request() blocks the caller; arequest() is its asyncio version, running on a pooled aiohttp session
+    (one per event loop), so many prompts can be in flight at once without blocking the loop.
+    stream() and astream() yield the text as the Model Provider generates it.
+
+    With a ResponseCache in 'cache', answers to prompts already asked (with the same options) are reused.
+    Identical prompts asked while the first one is still waiting for the Model Provider share its answer
+    (request with request, arequest with arequest); 'coalesced' counts the requests saved.
+
+    Latencies, sizes and statuses of every request are recorded in 'metrics' (see Metrics).
+
+    Warm-up: warm_up() (or awarm_up()) loads the model before the first prompt needs it; Ollama keeps it loaded
+    for 'keep_alive' (e.g. '30m', or -1 for ever; None leaves the server default) after each request.
+    With a 'ping_interval' (seconds), keep_warm() warms the model up again whenever it was idle that long,
+    so it is never unloaded between prompts.
+
+    Example:
+    provider = ModelProvider(base_url=URL, type='ollama', model='llama3', keep_alive='30m', ping_interval=600)
+    print(provider.models())
+    await provider.awarm_up()
+    asyncio.create_task(provider.keep_warm())
+    """
+    POOL_SIZE = 10
+    CONNECT_TIMEOUT = 5.0
+    READ_TIMEOUT = 120.0
+
+    def __init__(self, base_url, type=None, api_key=None, model=None, 
+                 pool_size:int=POOL_SIZE, connect_timeout:float=CONNECT_TIMEOUT, read_timeout:float=READ_TIMEOUT,
+                 cache:ResponseCache=None, metrics:Metrics=None, keep_alive=None, ping_interval:float=None):
         self.base_url = base_url
         self.api_key = api_key
         self.type = None
@@ -97,6 +631,17 @@ class ModelProvider():
         self.req_maker = None
         self.delta = -1
         self.response = None
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else Metrics.DEFAULT
+        self.metrics.providers.add(self)
+        self.keep_alive = keep_alive
+        self.ping_interval = ping_interval
+        self.last_used = 0.0
+        self._flight = SingleFlight()
+        self._session = None
+        self._asession = None
 
 
         if type == 'ollama':
@@ -107,31 +652,177 @@ class ModelProvider():
             self.type = 'open-webui'
         return
 
+    @property
+    def coalesced(self) -> int:
+        return self._flight.coalesced
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Pooled keep-alive HTTP session, created on first use
+        """
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers["Content-Type"] = "application/json"
+            if self.api_key: 
+                session.headers["Authorization"] = f"Bearer {self.api_key}"
+            self._session = session
+        return self._session
+
+    def close(self):
+        """
+        Close the pooled connections
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        return
+
+    async def asession(self) -> aiohttp.ClientSession:
+        """
+        Pooled keep-alive aiohttp session for the running event loop, created on first use
+        (the session of a previous event loop is closed)
+        """
+        loop = asyncio.get_running_loop()
+        if self._asession is None or self._asession[0] is not loop or self._asession[1].closed:
+            if self._asession is not None:
+                await self.aclose()
+            headers = {"Content-Type": "application/json"}
+            if self.api_key: 
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            connect_timeout, read_timeout = self.timeout
+            session = aiohttp.ClientSession(headers=headers,
+                                            connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout))
+            self._asession = (loop, session)
+        return self._asession[1]
+
+    async def aclose(self):
+        """
+        Close the pooled connections of the asyncio session 
+        (on its own event loop, if that one is still running in another thread)
+        """
+        if self._asession is not None:
+            loop, session = self._asession
+            self._asession = None
+            if session.closed:
+                return
+            elif loop is not asyncio.get_running_loop() and loop.is_running():
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop))
+            else:
+                await session.close()
+        return
+
+    def _failure(self, timeout:bool=False) -> str:
+        """
+        Error message for a request that timed out or could not reach the Model Provider
+        """
+        if timeout:
+            return f"!!ERROR!! Request timed out (connect={self.timeout[0]}s, read={self.timeout[1]}s) on URL({self.base_url})"
+        return f"!!ERROR!! Request failed! You need to adjust .env with URL({self.base_url})"
+
     def _call(self, url, payload=None):
         """
         Issue the HTTP-Request to the Model Provider
         """
-        headers = dict()
-        headers["Content-Type"] = "application/json"
-        if self.api_key: 
-            headers["Authorization"] = f"Bearer {self.api_key}"
-        
+        start_time = time.time()
         try:
-            start_time = time.time()
-            response = requests.post(url=url, data=payload, headers=headers)
+            response = self.session.post(url=url, data=payload, timeout=self.timeout)
             delta = time.time() - start_time
+        except requests.Timeout:
+            self._observe('timeout', time.time() - start_time, None, payload)
+            return -1, self._failure(timeout=True)
         except:
-            return -1, f"!!ERROR!! Request failed! You need to adjust .env with URL({self.base_url})"
+            self._observe('error', time.time() - start_time, None, payload)
+            return -1, self._failure()
         
+        self._observe(response.status_code, delta, response.elapsed.total_seconds(), payload, len(response.content))
         return delta, response
 
+    async def _acall(self, url, payload=None):
+        """
+        Issue the HTTP-Request to the Model Provider (asyncio version of _call), returning (delta, status, text)
+        """
+        start_time = time.time()
+        try:
+            session = await self.asession()
+            async with session.post(url=url, data=payload) as response:
+                ttfb = time.time() - start_time
+                body = await response.read()
+                text = body.decode(response.get_encoding())
+            delta = time.time() - start_time
+        except asyncio.TimeoutError:
+            self._observe('timeout', time.time() - start_time, None, payload)
+            return -1, None, self._failure(timeout=True)
+        except Exception:
+            self._observe('error', time.time() - start_time, None, payload)
+            return -1, None, self._failure()
+        
+        self._observe(response.status, delta, ttfb, payload, len(body))
+        return delta, response.status, text
 
-    def models(self):
+    def labels(self) -> tuple:
         """
-        Issue request about Models Available
+        Metric labels of this provider
         """
-        url = self.req_maker.url_models(base_url=self.url)
-        return self._call(url=url)
+        return (('type', self.type or ''), ('model', self.model or ''), ('provider', self.base_url or ''))
+
+    def _observe(self, status, elapsed:float, ttfb:float=None, payload:str=None, received:int=0):
+        """
+        Record one request in the metrics
+        """
+        self.last_used = time.time()
+        labels = self.labels()
+        self.metrics.inc('requests_total', labels + (('status', str(status)),))
+        self.metrics.observe('request_seconds', labels, elapsed)
+        if ttfb is not None:
+            self.metrics.observe('ttfb_seconds', labels, ttfb)
+        self.metrics.observe('request_bytes', labels, len(payload) if payload else 0, Metrics.BYTES)
+        self.metrics.observe('response_bytes', labels, received, Metrics.BYTES)
+        return
+
+
+    def models(self) -> list:
+        """
+        Names of the Models Available at the Model Provider, or None if they could not be listed
+        """
+        try:
+            response = self.session.get(url=self.req_maker.url_models(self.base_url), timeout=self.timeout)
+            return self.req_maker.unpackage_models(response.json()) if response.status_code == 200 else None
+        except (requests.RequestException, ValueError):
+            return None
+
+    def warm_up(self) -> bool:
+        """
+        Load the model at the Model Provider ahead of the first prompt; True if it answered
+        """
+        payload = json.dumps(self.req_maker.warm_up(self.model, self.keep_alive))
+        delta, response = self._call(url=self.req_maker.url_chat(self.base_url), payload=payload)
+        return not isinstance(response, str) and response.status_code == 200
+
+    async def awarm_up(self) -> bool:
+        """
+        Same as warm_up, asyncio version
+        """
+        payload = json.dumps(self.req_maker.warm_up(self.model, self.keep_alive))
+        delta, status, text = await self._acall(url=self.req_maker.url_chat(self.base_url), payload=payload)
+        return status == 200
+
+    async def keep_warm(self):
+        """
+        Warm the model up whenever it has been idle for 'ping_interval' seconds (run it as an asyncio task)
+        """
+        while self.ping_interval:
+            idle = time.time() - self.last_used
+            if idle >= self.ping_interval:
+                if not await self.awarm_up(): 
+                    print(f'ModelProvider: WARNING, keep-alive ping to {self.base_url} failed')
+                idle = 0
+            await asyncio.sleep(self.ping_interval - idle)
+        return
 
 
     def request(self, prompt, **kwargs):
@@ -141,41 +832,778 @@ class ModelProvider():
         Unpackage the response, it any
         """
 
-        ## (1) Creates the payload through the ModelRequestMaker
-        url = self.req_maker.url_chat(self.base_url)
-        payload = self.req_maker.package(model=self.model, prompt=prompt, **kwargs)
-        payload = json.dumps(payload) if payload else None
+        ## (0) Answer from the cache, or from the same request already in flight, if possible
+        key, result = self._cached(prompt, kwargs)
+        if result is not None:
+            return result
+        return self._flight.call(key, self._request, key, prompt, **kwargs)
 
-        print('P->', url, payload)
+    def _request(self, key, prompt, **kwargs):
+        """
+        Request (see request) with no cache nor coalescing
+        """
+
+        ## (1) Creates the payload through the ModelRequestMaker
+        url, payload = self._prepare(prompt, **kwargs)
 
         ## (2) Creates the HTTP-Req
         delta, response = self._call(url=url, payload=payload)
 
         # (3) Load the results
-        if response is None:
-            self.delta = -1
+        if response is None or isinstance(response, str):
+            return self._load(delta, None, response)
+        return self._remember(key, response.status_code, self._load(delta, response.status_code, response.text))
+
+    def stream(self, prompt, **kwargs):
+        """
+        Same as request, yielding the pieces of text as they arrive.
+        Errors are yielded as a single '!!ERROR!!' piece.
+        """
+        key, result = self._cached(prompt, kwargs)
+        if result is not None:
+            yield result
+            return
+
+        url, payload = self._prepare(prompt, stream=True, **kwargs)
+        parts, status, ttfb = [], 'error', None
+        start_time = time.time()
+        try:
+            with self.session.post(url=url, data=payload, timeout=self.timeout, stream=True) as response:
+                status = response.status_code
+                if status != 200:
+                    yield self._load(-1, status, response.text)
+                    return
+                for line in response.iter_lines(decode_unicode=True):
+                    chunk = self.req_maker.unpackage_chunk(line) if line else None
+                    if chunk:
+                        ttfb = ttfb or time.time() - start_time
+                        parts.append(chunk)
+                        yield chunk
+        except requests.Timeout:
+            status = 'timeout'
+            yield self._load(-1, None, self._failure(timeout=True))
+            return
+        except requests.RequestException:
+            status = 'error'
+            yield self._load(-1, None, self._failure())
+            return
+        finally:
+            self._observe(status, time.time() - start_time, ttfb, payload, sum(map(len, parts)))
+
+        self.delta = round(time.time() - start_time, 3)
+        self.response = None
+        self.result = self._remember(key, 200, ''.join(parts))
+        return
+
+    async def astream(self, prompt, **kwargs):
+        """
+        Same as stream, as an asyncio generator.
+        """
+        key, result = await self._acached(prompt, kwargs)
+        if result is not None:
+            yield result
+            return
+
+        url, payload = self._prepare(prompt, stream=True, **kwargs)
+        parts, status, ttfb = [], 'error', None
+        start_time = time.time()
+        try:
+            session = await self.asession()
+            async with session.post(url=url, data=payload) as response:
+                status = response.status
+                if status != 200:
+                    yield self._load(-1, status, await response.text())
+                    return
+                async for line in response.content:
+                    chunk = self.req_maker.unpackage_chunk(line.decode('utf-8'))
+                    if chunk:
+                        ttfb = ttfb or time.time() - start_time
+                        parts.append(chunk)
+                        yield chunk
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            yield self._load(-1, None, self._failure(timeout=True))
+            return
+        except aiohttp.ClientError:
+            status = 'error'
+            yield self._load(-1, None, self._failure())
+            return
+        finally:
+            self._observe(status, time.time() - start_time, ttfb, payload, sum(map(len, parts)))
+
+        self.delta = round(time.time() - start_time, 3)
+        self.response = None
+        self.result = await self._aremember(key, 200, ''.join(parts))
+        return
+
+    async def arequest(self, prompt, **kwargs):
+        """
+        Same as request, awaiting the Model Provider without blocking the event loop.
+        """
+        key, result = await self._acached(prompt, kwargs)
+        if result is not None:
+            return result
+        return await self._flight.acall(key, self._arequest, key, prompt, **kwargs)
+
+    async def _arequest(self, key, prompt, **kwargs):
+        """
+        Same as _request, on the asyncio session
+        """
+        url, payload = self._prepare(prompt, **kwargs)
+        delta, status, text = await self._acall(url=url, payload=payload)
+        return await self._aremember(key, status, self._load(delta, status, text))
+
+    def _cached(self, prompt, options:dict):
+        """
+        Return (key, cached response or None); the key identifies the request for the cache and for coalescing
+        """
+        key = ResponseCache.key(self.type, self.model, prompt, options)
+        if self.cache is None:
+            return key, None
+        return key, self._hit(self.cache.get(key))
+
+    async def _acached(self, prompt, options:dict):
+        """
+        Same as _cached, off the event loop for the disk tier of the cache
+        """
+        key = ResponseCache.key(self.type, self.model, prompt, options)
+        if self.cache is None:
+            return key, None
+        return key, self._hit(await self.cache.aget(key))
+
+    def _hit(self, result):
+        """ Record a cached response (or None) as the last result """
+        if result is not None:
+            self.delta = 0
             self.response = None
-            self.result = "!!ERROR!! There was no response (?)"
-        elif isinstance(response,str):
+            self.result = result
+        return result
+
+    def _remember(self, key, status, result):
+        """
+        Cache a successful response (if there is a cache) and return it
+        """
+        if self.cache is not None and status == 200 and result:
+            self.cache.put(key, result)
+        return result
+
+    async def _aremember(self, key, status, result):
+        """
+        Same as _remember, off the event loop for the disk tier of the cache
+        """
+        if self.cache is not None and status == 200 and result:
+            await self.cache.aput(key, result)
+        return result
+
+    def _prepare(self, prompt, **kwargs):
+        """
+        Return the (url, payload) of a prompt, through the ModelRequestMaker
+        """
+        url = self.req_maker.url_chat(self.base_url)
+        if self.keep_alive is not None:
+            kwargs.setdefault('keep_alive', self.keep_alive)
+        payload = self.req_maker.package(model=self.model, prompt=prompt, **kwargs)
+        payload = json.dumps(payload) if payload else None
+
+        print('P->', url, payload)
+        return url, payload
+
+    def _load(self, delta, status, text):
+        """
+        Load the results of a request: HTTP status and body text, or status=None and an error message in text.
+        """
+        if status is None:
             self.delta = -1
             self.response = None
-            self.result = response
-        elif response.status_code == 401:
+            self.result = text if text else "!!ERROR!! There was no response (?)"
+        elif status == 401:
             self.delta = -1
             self.response = None
             self.result = f"!!ERROR!! Authentication issue. You need to adjust .env with API_KEY ({self.base_url})"
-        elif response.status_code == 200:
+        elif status == 200:
             self.delta = round(delta, 3)
-            self.response = response.json()
+            self.response = json.loads(text)
             self.result = self.req_maker.unpackage(self.response)
         else: 
             self.delta = -1
             self.response = None
-            self.result = f"!!ERROR!! HTTP Response={response.status_code}, {response.text}"
+            self.result = f"!!ERROR!! HTTP Response={status}, {text}"
         
         return self.result 
 
 
+###
+### MODEL PROVIDER POOL
+###
+
+class PoolMember():
+    """
+    State of one ModelProvider in a ProviderPool
+    """
+    __slots__ = ('provider', 'outstanding', 'latency', 'failures', 'ejected_until', 'requests')
+
+    def __init__(self, provider:ModelProvider):
+        self.provider = provider
+        self.outstanding = 0        # requests in flight
+        self.latency = 0.0          # moving average of successful requests, in seconds
+        self.failures = 0           # consecutive failures
+        self.ejected_until = 0.0    # time.monotonic() until which it gets no requests
+        self.requests = 0
+        return
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.provider.base_url}, outstanding={self.outstanding}, latency={self.latency:.3f}, failures={self.failures})'
+
+
+class ProviderPool():
+    """
+    Spreads prompts over several ModelProviders (e.g. one per Ollama host), offering the same 
+    request/arequest/stream/astream interface as a single ModelProvider.
+
+    Selection ('policy'):
+        'least-outstanding' : the provider with the fewest requests in flight (then, the fastest)
+        'latency'           : the provider with the lowest (requests in flight + 1) x average latency
+
+    Health: a provider failing 'max_failures' requests in a row (a '!!ERROR!!' answer) is ejected for 'cooldown'
+    seconds, then gets requests again; one more failure ejects it again. A failed request is retried once on
+    another provider.
+
+    Hedging: with hedge=True, a request still running after the 95th percentile of the recent latencies
+    is also sent to a second provider, and the first answer wins.
+
+    Example:
+    pool = ProviderPool([ModelProvider(base_url=url, type='ollama', model='llama3') for url in URLS], hedge=True)
+    engine.model_provider = pool
+    """
+    LEAST_OUTSTANDING = 'least-outstanding'
+    LATENCY = 'latency'
+
+    MAX_FAILURES = 3
+    COOLDOWN = 30.0
+    HEDGE_QUANTILE = 0.95
+    HEDGE_SAMPLES = 20      # latencies needed before hedging
+    LATENCY_WEIGHT = 0.2    # weight of the last latency in the moving average
+
+    def __init__(self, providers:list, policy:str=LEAST_OUTSTANDING, max_failures:int=MAX_FAILURES, 
+                 cooldown:float=COOLDOWN, hedge:bool=False):
+        if not providers:
+            raise ValueError('ProviderPool: expected at least one ModelProvider')
+        elif policy not in (ProviderPool.LEAST_OUTSTANDING, ProviderPool.LATENCY):
+            raise ValueError(f'ProviderPool: unknown policy {policy}')
+        self.members = [PoolMember(provider) for provider in providers]
+        self.policy = policy
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.hedge = hedge
+        self.hedged = 0
+        self._flight = SingleFlight()
+        self._latencies = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self._executor = None
+        return
+
+    @property
+    def type(self):
+        return self.members[0].provider.type
+
+    @property
+    def model(self):
+        return self.members[0].provider.model
+
+    @property
+    def base_url(self):
+        return ', '.join(member.provider.base_url for member in self.members)
+
+    @property
+    def cache(self):
+        return self.members[0].provider.cache
+
+    @property
+    def coalesced(self) -> int:
+        return self._flight.coalesced
+
+    def close(self):
+        for member in self.members:
+            member.provider.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        return
+
+    async def aclose(self):
+        for member in self.members:
+            await member.provider.aclose()
+        return
+
+    def models(self) -> list:
+        return self.members[0].provider.models()
+
+    def warm_up(self) -> bool:
+        return all([member.provider.warm_up() for member in self.members])
+
+    async def awarm_up(self) -> bool:
+        return all(await asyncio.gather(*(member.provider.awarm_up() for member in self.members)))
+
+    async def keep_warm(self):
+        await asyncio.gather(*(member.provider.keep_warm() for member in self.members))
+        return
+
+    ##
+    ## SELECTION AND HEALTH
+    ##
+
+    def _pick(self, exclude=None) -> PoolMember:
+        """
+        Choose a provider (not 'exclude') and count the request as outstanding; None if there is no other
+        """
+        now = time.monotonic()
+        with self._lock:
+            members = [member for member in self.members if member is not exclude]
+            if not members:
+                return None
+            healthy = [member for member in members if member.ejected_until <= now]
+            if not healthy:
+                member = min(members, key=lambda member: member.ejected_until) #-> the first one back
+            elif self.policy == ProviderPool.LATENCY:
+                member = min(healthy, key=lambda member: ((member.outstanding + 1) * member.latency, member.outstanding))
+            else:
+                member = min(healthy, key=lambda member: (member.outstanding, member.latency))
+            member.outstanding += 1
+            member.requests += 1
+        return member
+
+    def _done(self, member:PoolMember, started:float, result, sample:bool=True) -> bool:
+        """
+        Record the outcome of a request picked with _pick; returns True if it succeeded.
+        Latencies of whole answers (not streams) are sampled for the hedging threshold.
+        """
+        elapsed = time.monotonic() - started
+        failed = not isinstance(result, str) or result.startswith('!!ERROR!!')
+        with self._lock:
+            member.outstanding -= 1
+            if failed:
+                member.failures += 1
+                if member.failures >= self.max_failures:
+                    member.ejected_until = time.monotonic() + self.cooldown
+                    member.failures = self.max_failures - 1  #-> one more failure after the cooldown ejects it again
+            else:
+                member.failures = 0
+                member.ejected_until = 0.0
+                member.latency = elapsed if not member.latency else \
+                    (1 - ProviderPool.LATENCY_WEIGHT) * member.latency + ProviderPool.LATENCY_WEIGHT * elapsed
+                if sample:
+                    self._latencies.append(elapsed)
+        return not failed
+
+    def threshold(self) -> float:
+        """
+        Latency (seconds) after which a request is hedged, None until enough requests were seen
+        """
+        with self._lock:
+            if len(self._latencies) < ProviderPool.HEDGE_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[int(ProviderPool.HEDGE_QUANTILE * (len(latencies) - 1))]
+
+    ##
+    ## REQUESTS
+    ##
+
+    def _request(self, member:PoolMember, prompt, kwargs):
+        started = time.monotonic()
+        result = None
+        try:
+            result = member.provider.request(prompt, **kwargs)
+        finally:
+            self._done(member, started, result)
+        return result
+
+    async def _arequest(self, member:PoolMember, prompt, kwargs):
+        started = time.monotonic()
+        result = None
+        try:
+            result = await member.provider.arequest(prompt, **kwargs)
+        except asyncio.CancelledError:
+            # A hedge loser (or an abandoned request) is not a failure: only stop counting it
+            with self._lock:
+                member.outstanding -= 1
+            raise
+        except BaseException:
+            self._done(member, started, result)
+            raise
+        self._done(member, started, result)
+        return result
+
+    def request(self, prompt, **kwargs):
+        """
+        Request (see ModelProvider.request) on the chosen provider, hedged and retried as configured.
+        Identical prompts in flight share one request, rather than going to different providers.
+        """
+        key = ResponseCache.key(self.type, self.model, prompt, kwargs)
+        return self._flight.call(key, self._route, prompt, kwargs)
+
+    def _route(self, prompt, kwargs):
+        """ Request (see request) with no coalescing """
+        member = self._pick()
+        threshold = self.threshold() if self.hedge and len(self.members) > 1 else None
+        if threshold is None:
+            result = self._request(member, prompt, kwargs)
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(thread_name_prefix='owlmind-hedge')
+            first = self._executor.submit(self._request, member, prompt, kwargs)
+            done, pending = wait({first}, timeout=threshold)
+            if done:
+                result = first.result() #-> answered in time: no hedge, retried below on error
+            else:
+                second = self._pick(exclude=member)
+                pending.add(self._executor.submit(self._request, second, prompt, kwargs))
+                self.hedged += 1
+                while True:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results = [future.result() for future in done]
+                    result = next((result for result in results if not result.startswith('!!ERROR!!')), results[0])
+                    if not pending or not result.startswith('!!ERROR!!'):
+                        break  #-> the other request (if any) finishes on its own
+                return result
+
+        if result.startswith('!!ERROR!!'):
+            other = self._pick(exclude=member)
+            if other is not None:
+                result = self._request(other, prompt, kwargs)
+        return result
+
+    async def arequest(self, prompt, **kwargs):
+        """
+        Same as request, awaiting the providers without blocking the event loop
+        """
+        key = ResponseCache.key(self.type, self.model, prompt, kwargs)
+        return await self._flight.acall(key, self._aroute, prompt, kwargs)
+
+    async def _aroute(self, prompt, kwargs):
+        """ Same as _route, awaiting the providers """
+        member = self._pick()
+        threshold = self.threshold() if self.hedge and len(self.members) > 1 else None
+        if threshold is None:
+            result = await self._arequest(member, prompt, kwargs)
+        else:
+            first = asyncio.ensure_future(self._arequest(member, prompt, kwargs))
+            done, pending = await asyncio.wait({first}, timeout=threshold)
+            if done:
+                result = first.result()
+            else:
+                second = self._pick(exclude=member)
+                pending.add(asyncio.ensure_future(self._arequest(second, prompt, kwargs)))
+                self.hedged += 1
+                while True:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    results = [task.result() for task in done]
+                    result = next((result for result in results if not result.startswith('!!ERROR!!')), results[0])
+                    if not pending or not result.startswith('!!ERROR!!'):
+                        break
+                for task in pending:
+                    task.cancel()
+                return result
+
+        if result.startswith('!!ERROR!!'):
+            other = self._pick(exclude=member)
+            if other is not None:
+                result = await self._arequest(other, prompt, kwargs)
+        return result
+
+    def stream(self, prompt, **kwargs):
+        """
+        Stream (see ModelProvider.stream) from the chosen provider
+        """
+        member = self._pick()
+        started = time.monotonic()
+        parts = []
+        try:
+            for chunk in member.provider.stream(prompt, **kwargs):
+                parts.append(chunk)
+                yield chunk
+        finally:
+            self._done(member, started, ''.join(parts) if parts else None, sample=False)
+        return
+
+    async def astream(self, prompt, **kwargs):
+        """
+        Same as stream, as an asyncio generator
+        """
+        member = self._pick()
+        started = time.monotonic()
+        parts = []
+        try:
+            async for chunk in member.provider.astream(prompt, **kwargs):
+                parts.append(chunk)
+                yield chunk
+        finally:
+            self._done(member, started, ''.join(parts) if parts else None, sample=False)
+        return
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.policy}, hedged={self.hedged})[{", ".join(repr(member) for member in self.members)}]'
+
+
+###
+### ADMISSION CONTROL
+###
+
+class AdmissionWaiter():
+    """
+    A request waiting for a slot in AdmissionControl, from a thread or from an event loop
+    """
+    __slots__ = ('priority', 'seq', 'event', 'loop', 'future', 'admitted', 'cancelled')
+
+    def __init__(self, priority:int, seq:int, loop=None):
+        self.priority = priority
+        self.seq = seq
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.admitted = self.cancelled = False
+        return
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self):
+        """ Hand the slot to this waiter (under the AdmissionControl lock) """
+        self.admitted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(True))
+        return
+
+
+class AdmissionControl():
+    """
+    Admission layer in front of a ModelProvider (or ProviderPool), with its request/arequest/stream/astream interface.
+
+    At most 'max_concurrent' requests reach the provider at once; the others wait in a queue of up to
+    'max_queue' requests, served by priority (lower first), then in arrival order. When the queue is full,
+    or a request waited more than 'max_wait' seconds, it is answered at once with BUSY instead.
+    Threads (request, stream) and event loops (arequest, astream) share the same slots.
+
+    Priorities (see classify): DIRECT (e.g. DMs), SHORT prompts, then NORMAL.
+    'admitted', 'queued' and 'shed' count the requests.
+
+    Example:
+    engine.model_provider = AdmissionControl(ModelProvider(base_url=URL, type='ollama'), max_concurrent=4, max_queue=32)
+    """
+    DIRECT, SHORT, NORMAL = range(3)
+    SHORT_PROMPT = 200  # characters
+
+    MAX_CONCURRENT = 4
+    MAX_QUEUE = 32
+    BUSY = "!!BUSY!! Too many requests right now, please try again in a moment."
+
+    def __init__(self, provider, max_concurrent:int=MAX_CONCURRENT, max_queue:int=MAX_QUEUE, max_wait:float=None):
+        self.provider = provider
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.admitted = self.queued = self.shed = 0
+        self._waiting = []      # heap of AdmissionWaiter
+        self._flight = SingleFlight()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        return
+
+    @property
+    def type(self):
+        return self.provider.type
+
+    @property
+    def model(self):
+        return self.provider.model
+
+    @property
+    def base_url(self):
+        return self.provider.base_url
+
+    @property
+    def cache(self):
+        return self.provider.cache
+
+    @property
+    def coalesced(self) -> int:
+        return self._flight.coalesced
+
+    def close(self):
+        return self.provider.close()
+
+    async def aclose(self):
+        return await self.provider.aclose()
+
+    def models(self) -> list:
+        return self.provider.models()
+
+    def warm_up(self) -> bool:
+        return self.provider.warm_up()
+
+    async def awarm_up(self) -> bool:
+        return await self.provider.awarm_up()
+
+    async def keep_warm(self):
+        return await self.provider.keep_warm()
+
+    @staticmethod
+    def classify(prompt:str, direct:bool=False) -> int:
+        """
+        Priority of a prompt: DIRECT for direct messages, SHORT for short prompts, NORMAL otherwise
+        """
+        if direct:
+            return AdmissionControl.DIRECT
+        return AdmissionControl.SHORT if len(prompt) <= AdmissionControl.SHORT_PROMPT else AdmissionControl.NORMAL
+
+    ##
+    ## SLOTS
+    ##
+
+    def _enter(self, priority:int, loop=None):
+        """
+        Take a slot: returns True (admitted), False (shed), or an AdmissionWaiter to wait on
+        """
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiting:
+                self.active += 1
+                self.admitted += 1
+                return True
+            elif len(self._waiting) >= self.max_queue:
+                self.shed += 1
+                return False
+            waiter = AdmissionWaiter(priority, next(self._seq), loop)
+            heapq.heappush(self._waiting, waiter)
+            self.queued += 1
+            return waiter
+
+    def _cancel(self, waiter:AdmissionWaiter) -> bool:
+        """
+        Give up waiting; returns False if the slot was handed over meanwhile (and must be released)
+        """
+        with self._lock:
+            if waiter.admitted:
+                return False
+            waiter.cancelled = True
+            self._waiting.remove(waiter)
+            heapq.heapify(self._waiting)
+            self.shed += 1
+        return True
+
+    def _leave(self):
+        """
+        Release a slot, handing it to the first waiter if any
+        """
+        with self._lock:
+            if self._waiting:
+                heapq.heappop(self._waiting).wake()
+                self.admitted += 1
+            else:
+                self.active -= 1
+        return
+
+    def acquire(self, priority:int=NORMAL) -> bool:
+        """
+        Wait for a slot (from a thread); False if the request is shed
+        """
+        waiter = self._enter(priority)
+        if not isinstance(waiter, AdmissionWaiter):
+            return waiter
+        if waiter.event.wait(self.max_wait) or not self._cancel(waiter):
+            return True
+        return False
+
+    async def aacquire(self, priority:int=NORMAL) -> bool:
+        """
+        Wait for a slot (from an event loop); False if the request is shed
+        """
+        waiter = self._enter(priority, asyncio.get_running_loop())
+        if not isinstance(waiter, AdmissionWaiter):
+            return waiter
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            return not self._cancel(waiter)
+        except asyncio.CancelledError:
+            if not self._cancel(waiter):
+                self._leave()
+            raise
+
+    ##
+    ## REQUESTS
+    ##
+
+    def request(self, prompt, priority:int=None, **kwargs):
+        """
+        Request (see ModelProvider.request) once admitted; BUSY if shed.
+        priority defaults to classify(prompt).
+        Identical prompts in flight share the first one's slot and answer, rather than taking a slot each.
+        """
+        key = ResponseCache.key(self.type, self.model, prompt, kwargs)
+        return self._flight.call(key, self._admit, prompt, priority, kwargs)
+
+    def _admit(self, prompt, priority, kwargs):
+        """ Request (see request) with no coalescing """
+        if not self.acquire(AdmissionControl.classify(prompt) if priority is None else priority):
+            return AdmissionControl.BUSY
+        try:
+            return self.provider.request(prompt, **kwargs)
+        finally:
+            self._leave()
+
+    async def arequest(self, prompt, priority:int=None, **kwargs):
+        """
+        Same as request, from an event loop
+        """
+        key = ResponseCache.key(self.type, self.model, prompt, kwargs)
+        return await self._flight.acall(key, self._aadmit, prompt, priority, kwargs)
+
+    async def _aadmit(self, prompt, priority, kwargs):
+        """ Same as _admit, from an event loop """
+        if not await self.aacquire(AdmissionControl.classify(prompt) if priority is None else priority):
+            return AdmissionControl.BUSY
+        try:
+            return await self.provider.arequest(prompt, **kwargs)
+        finally:
+            self._leave()
+
+    def stream(self, prompt, priority:int=None, **kwargs):
+        """
+        Stream (see ModelProvider.stream), holding the slot until the stream ends; BUSY if shed
+        """
+        if not self.acquire(AdmissionControl.classify(prompt) if priority is None else priority):
+            yield AdmissionControl.BUSY
+            return
+        try:
+            yield from self.provider.stream(prompt, **kwargs)
+        finally:
+            self._leave()
+
+    async def astream(self, prompt, priority:int=None, **kwargs):
+        """
+        Same as stream, as an asyncio generator
+        """
+        if not await self.aacquire(AdmissionControl.classify(prompt) if priority is None else priority):
+            yield AdmissionControl.BUSY
+            return
+        try:
+            async for chunk in self.provider.astream(prompt, **kwargs):
+                yield chunk
+        finally:
+            self._leave()
+
+    def stats(self) -> dict:
+        return {'active': self.active, 'waiting': len(self._waiting), 
+                'admitted': self.admitted, 'queued': self.queued, 'shed': self.shed, 'coalesced': self.coalesced}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(max_concurrent={self.max_concurrent}, max_queue={self.max_queue})[{self.stats()}]'
+
+
 ##
 ## DEBUG
 ## TO BE DELETED
@@ -192,5 +1620,6 @@ if __name__ == '__main__':
 
     # Configure a ModelProvider if there is an URL
     provider = ModelProvider(type=TYPE,  base_url=URL, api_key=API_KEY, model=MODEL) if URL else None
+    print(provider.models())
     print(provider.request(prompt="1+1"))
 
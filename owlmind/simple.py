@@ -22,33 +22,59 @@
 # Generative AI has been used extensively while developing this package.
 # 
 
+import os
 import csv
-from .agent import Plan
-from .bot import BotEngine, BotMessage
+import glob
+import time
+import asyncio
+import threading
+from hashlib import blake2b
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .context import Context
+from .agent import Plan, PlanBase
+from .bot import BotEngine, BotMessage, ConversationMemory
+from .pipeline import AdmissionControl, Metrics
 
 class SimpleEngine(BotEngine):
     """
     SimpleEngine provides a very simple Rule-based message processing from a list of predefined plans (Rules).
 
     Methods:
-        load(file_name):
-            Loads plans from a CSV file. Each row in the file should contain conditions as columns (excluding 'action') and an 'action' column specifying the associated action.
+        load(file_name, snapshot, workers):
+            Loads plans from a CSV file, or from the CSV files in a directory or glob. Each row in the file should contain conditions as columns (excluding 'action') and an 'action' column specifying the associated action.
             See example for the CVS format in the method documentation.
 
+        compile(file_name):
+            Parses a CSV file into plans and saves them as a binary snapshot, used by load(snapshot=True).
+
+        reload(file_name):
+            Rebuilds the plans from the rule file and swaps them in at once, reusing the unchanged ones.
+
+        watch(interval):
+            Reloads the rule file automatically when it changes on disk.
+
         process(context):
             Processes a BotMessage context, matches it against the loaded plans, and assigns a response based on the best match.
+
+    Prompts for the Model Provider carry the recent turns of the conversation (per author and channel) from 'memory',
+    a ConversationMemory (None sends the message alone).
     """
     VERSION = "1.2"
+    SNAPSHOT = '.snapshot'
 
     def __init__(self, id):
         super().__init__(id)
         self.rule_file = None
         self.model_provider = None
+        self.memory = ConversationMemory()
+        self._reload_lock = threading.Lock()
+        self._watcher = None
         return 
 
-    def load(self, file_name):
+    def load(self, file_name, snapshot:bool=False, workers:int=None):
         """
-        Load plans from a CSV file.
+        Load plans from a CSV file, or from every CSV file in a directory (and its sub-directories) or glob.
 
         The CSV file should have a structure where:
             Header defines the FIELDS for matching and a column named 'response'
@@ -63,6 +89,8 @@ class SimpleEngine(BotEngine):
         author_fullname : Author full name (global_name)
         message         : Message content
 
+        Empty cells do not constrain their FIELD.
+
         Example of CSV file:
 
         message, response
@@ -70,33 +98,298 @@ class SimpleEngine(BotEngine):
         *hello*, Hello!
         *, I dont know how to respond to this message.
 
+        With several files, they are parsed in parallel on a pool of 'workers' processes 
+        (by default, one per CPU; workers=1 parses them here) and added to the plans in file order, as each one is ready.
+
+        With snapshot=True, the compiled plans of each file are read from file_name + SNAPSHOT when it was built
+        from the current contents of the CSV file; otherwise the CSV file is parsed and the snapshot (re)written.
         """
+        files = self._files(file_name)
+        base = file_name if os.path.isdir(file_name) else os.path.commonpath(files) if len(files) > 1 else None
         row_count = 0
-        try:
-            with open(file_name, mode='r', encoding='utf-8') as file:
-                self.rule_file = file_name
-                reader = csv.DictReader((row for row in file if row.strip() and not row.strip().startswith('#')), escapechar='\\')
-                for row in reader:
-                    condition = {"message" : row["message"].strip()}
-                    response = row["response"].strip()
-                    self += Plan(condition=condition, action=response)
-                    row_count += 1
-        except FileNotFoundError:
-            if self.debug: print(f'SimpleEngine.load(.): ERROR, file {file_name} not found.')
+        report = []
+        for rule_file, plans, elapsed in self._parse(files, snapshot, workers):
+            if plans is None:
+                if self.debug: print(f'SimpleEngine.load(.): ERROR, file {rule_file} not found.')
+                continue
+            
+            if len(self.plans):
+                for plan in plans:
+                    self += plan
+            else:
+                self.plans = plans #-> first file, adopt its PlanBase as it is
+            row_count += len(plans)
+            report.append(f'{os.path.relpath(rule_file, base) if base else rule_file}: {len(plans)} in {elapsed:.3f}s')
+
+        if report:
+            self.rule_file = file_name
+        elif self.debug and not files:
+            print(f'SimpleEngine.load(.): ERROR, file {file_name} not found.')
 
         ## Update announcement
-        self.announcement = f'SimpleEngine {self.id} loaded {row_count} Rules from {file_name}.'
+        self.announcement = f'SimpleEngine {self.id} loaded {row_count} Rules from {file_name}'
+        self.announcement += f' [{"; ".join(report)}].' if report else '.'
         return 
 
+    @staticmethod
+    def _files(file_name) -> list:
+        """
+        Rule files named by file_name: the file itself, the CSV files under a directory, or the files matching a glob.
+        """
+        if os.path.isdir(file_name):
+            return sorted(glob.glob(os.path.join(glob.escape(file_name), '**', '*.csv'), recursive=True))
+        elif glob.has_magic(file_name):
+            return sorted(glob.glob(file_name, recursive=True))
+        return [file_name]
+
+    def _parse(self, files:list, snapshot:bool=False, workers:int=None):
+        """
+        Iterate over (file_name, PlanBase or None if not found, seconds) for each rule file, in order.
+        More than one file is compiled on a process pool; results are yielded as soon as the next one is done.
+        If the pool breaks, the files not yielded yet are compiled here.
+        """
+        workers = workers or os.cpu_count() or 1
+        done = 0
+        if len(files) > 1 and workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=workers, initializer=SimpleEngine._setup, 
+                                         initargs=(Context.CASE_SENSITIVE,)) as pool:
+                    for result in pool.map(SimpleEngine._compile_file, files, [snapshot] * len(files)):
+                        done += 1
+                        yield result
+                return
+            except (OSError, BrokenProcessPool) as e:
+                if self.debug: print(f'SimpleEngine.load(.): WARNING, parsing on this process, {e}')
+        
+        for file_name in files[done:]:
+            yield SimpleEngine._compile_file(file_name, snapshot)
+        return
+
+    @staticmethod
+    def _setup(case_sensitive:bool):
+        """ Align a pool worker with the settings used to compile conditions """
+        Context.CASE_SENSITIVE = case_sensitive
+        return
+
+    @staticmethod
+    def _compile_file(file_name, snapshot:bool=False):
+        """
+        Compile one rule file into a PlanBase (from its snapshot, if asked and up-to-date).
+        Returns (file_name, PlanBase or None if not found, seconds).
+        """
+        started = time.perf_counter()
+        try:
+            plans = None
+            if snapshot:
+                plans = PlanBase.restore(file_name + SimpleEngine.SNAPSHOT, source=SimpleEngine._digest(file_name)) 
+            if plans is None:
+                plans = SimpleEngine._build(file_name, file_name + SimpleEngine.SNAPSHOT if snapshot else None)
+        except FileNotFoundError:
+            plans = None
+        return file_name, plans, time.perf_counter() - started
+
+    @staticmethod
+    def _read(file_name):
+        """
+        Iterate over the (condition, response) rows of a CSV rule file (see load).
+        """
+        with open(file_name, mode='r', encoding='utf-8') as file:
+            reader = csv.DictReader((row for row in file if row.strip() and not row.strip().startswith('#')), escapechar='\\')
+            for row in reader:
+                row = {field.strip() : value.strip() for field, value in row.items() if field and isinstance(value, str)}
+                response = row.pop('response', '')
+                yield {field : value for field, value in row.items() if value}, response
+        return
+
+    @staticmethod
+    def _digest(file_name) -> str:
+        """ Digest of a rule file contents, tagging the snapshots built from it """
+        with open(file_name, mode='rb') as file:
+            return blake2b(file.read(), digest_size=16).hexdigest()
+
+    def compile(self, file_name, snapshot_file=None) -> PlanBase:
+        """
+        Parse a CSV rule file (see load) into a new PlanBase and save it as a binary snapshot,
+        by default in file_name + SNAPSHOT. The snapshot carries a digest of the CSV file, 
+        so load(snapshot=True) ignores it once the CSV file changes.
+        Returns the PlanBase.
+        """
+        source = SimpleEngine._digest(file_name)
+        plans = SimpleEngine._build(file_name)
+        plans.snapshot(snapshot_file or file_name + SimpleEngine.SNAPSHOT, source=source)
+        return plans
+
+    @staticmethod
+    def _build(file_name, snapshot_file=None) -> PlanBase:
+        """ 
+        Parse a CSV rule file into a new PlanBase, saving it as a snapshot if snapshot_file is given.
+        The snapshot is only a cache: if it cannot be written (e.g. read-only directory), the plans are returned anyway.
+        """
+        source = SimpleEngine._digest(file_name) if snapshot_file else None
+        plans = PlanBase()
+        for condition, response in SimpleEngine._read(file_name):
+            plans += Plan(condition=condition, action=response)
+        if snapshot_file:
+            try:
+                plans.snapshot(snapshot_file, source=source)
+            except OSError as e:
+                if Context.DEBUG: print(f'SimpleEngine.load(.): WARNING, cannot write snapshot {snapshot_file}, {e}')
+        return plans
+
+    def reload(self, file_name=None):
+        """
+        Reload plans from a CSV file, directory or glob (by default, the last one loaded) without stopping the engine.
+
+        The new rules are parsed into a new PlanBase, which replaces the current one in a single step;
+        until then, the current plans keep serving messages. Plans whose fingerprint did not change
+        are reused as they are, so only new or changed rules are compiled.
+        Safe to run on a worker thread (e.g. asyncio.to_thread or the watch thread).
+        Returns the announcement, or None if the file could not be read (missing, unreadable, 
+        bad encoding or bad CSV); the current plans are kept then.
+        """
+        file_name = file_name or self.rule_file
+        if not file_name:
+            return None
+
+        with self._reload_lock:
+            live = self.plans
+            plans = PlanBase()
+            added = set()
+            try:
+                files = self._files(file_name)
+                if not files:
+                    raise FileNotFoundError(file_name)
+                for rule_file in files:
+                    for condition, response in self._read(rule_file):
+                        key = Plan.fingerprint_of(condition, response)
+                        plan = live.get(key)
+                        if plan is None:
+                            plan = Plan(condition=condition, action=response)
+                            added.add(key)
+                        plans += plan
+            except FileNotFoundError:
+                if self.debug: print(f'SimpleEngine.reload(.): ERROR, file {file_name} not found; keeping {len(live)} Rules.')
+                return None
+            except (OSError, ValueError, csv.Error) as e:
+                if self.debug: print(f'SimpleEngine.reload(.): ERROR, cannot read {file_name} ({e}); keeping {len(live)} Rules.')
+                return None
+
+            removed = len(live) - (len(plans) - len(added))
+            self.plans = plans #-> swap
+            self.rule_file = file_name
+            self.announcement = f'SimpleEngine {self.id} reloaded {len(plans)} Rules from {file_name} (+{len(added)} -{removed}).'
+        
+        if self.debug: print(self.announcement)
+        return self.announcement
+
+    def watch(self, interval:float=2.0):
+        """
+        Watch the rule files and reload them (see reload) whenever a file is added, removed, or changes its modification time or size.
+        The file is polled from a daemon thread every 'interval' seconds; stop it with unwatch().
+        """
+        if self._watcher or not self.rule_file:
+            return
+        
+        def stamp(file_name):
+            try:
+                stamps = []
+                for rule_file in self._files(file_name):
+                    stat = os.stat(rule_file)
+                    stamps.append((rule_file, stat.st_mtime_ns, stat.st_size))
+                return tuple(stamps) or None
+            except OSError:
+                return None
+
+        def run(stop):
+            last = stamp(self.rule_file)
+            while not stop.wait(interval):
+                current = stamp(self.rule_file)
+                if current and current != last:
+                    last = current
+                    try:
+                        self.reload()
+                    except Exception as e: #-> keep watching: the next change may fix it
+                        if self.debug: print(f'SimpleEngine.watch(.): ERROR, reload failed, {e}')
+            return
+
+        stop = threading.Event()
+        self._watcher = (threading.Thread(target=run, args=(stop,), name=f'{self.id}-watch', daemon=True), stop)
+        self._watcher[0].start()
+        return
+
+    def unwatch(self):
+        """ Stop watching the rule files """
+        if self._watcher:
+            thread, stop = self._watcher
+            stop.set()
+            thread.join()
+            self._watcher = None
+        return
+
     def process(self, context:BotMessage):
         """
         Simplified deliberation logic.
         """
+        prompt = self.respond(context)
+        if prompt is not None:
+            context.response = self.model_provider.request(prompt, **self.admission(context, prompt))
+            self.remember(context, context.response)
+        return
+
+    async def aprocess(self, context:BotMessage):
+        """
+        Same as process, awaiting the Model Provider (if a rule prompts it) instead of blocking the event loop.
+        When streaming, the Model Provider answer is left in context.stream for the caller to consume.
+        Rules are matched on a worker thread, so slow ones (e.g. guarded regexes) do not stall the event loop.
+        """
+        prompt = await asyncio.to_thread(self.respond, context)
+        if prompt is not None:
+            if self.streaming:
+                context.stream = self._remembered(context, self.model_provider.astream(prompt, **self.admission(context, prompt)))
+            else:
+                context.response = await self.model_provider.arequest(prompt, **self.admission(context, prompt))
+                self.remember(context, context.response)
+        return
+
+    def remember(self, context:BotMessage, answer:str):
+        """
+        Add the message and the Model Provider answer to the conversation memory (errors and BUSY answers are left out)
+        """
+        if self.memory is not None and answer and not answer.startswith('!!'):
+            self.memory.add(context, context['message'], answer)
+        return
+
+    async def _remembered(self, context:BotMessage, stream):
+        """
+        Pass the pieces of a streamed answer through, remembering the whole answer at the end
+        """
+        parts = []
+        async for chunk in stream:
+            parts.append(chunk)
+            yield chunk
+        self.remember(context, ''.join(parts))
+
+    def admission(self, context:BotMessage, prompt:str) -> dict:
+        """
+        Admission arguments for the Model Provider: the priority of the prompt, 
+        when it is behind an AdmissionControl (direct messages first, then short prompts)
+        """
+        if not isinstance(self.model_provider, AdmissionControl):
+            return dict()
+        return {'priority': AdmissionControl.classify(prompt, direct=context['server_name'] == '#dm')}
+
+    def respond(self, context:BotMessage):
+        """
+        Answer commands and match the rules, setting context.response.
+        Returns the prompt for the Model Provider when the picked rule is a '@prompt' action, None otherwise.
+        """
 
         if context['message'] == '/help':
             context.response = f'### Version: {BotMessage.VERSION}\n'
             context.response += f'### Help\n'
             context.response += f'* ``/info``: displays basic information\n'
+            context.response += f'* ``/stats``: displays Model Provider metrics\n'
+            context.response += f'* ``/forget``: forget this conversation\n'
             context.response += f'* ``/reload``: reload rule file'
         
         elif context['message'] == '/info':
@@ -106,38 +399,64 @@ class SimpleEngine(BotEngine):
                 context.response += f'### Model Provider:\n'
                 context.response += f'* type: {self.model_provider.type}\n'
                 context.response += f'* url: {self.model_provider.base_url}\n'
+                if self.model_provider.cache is not None:
+                    context.response += f'* cache: {self.model_provider.cache.stats()}\n'
+                if isinstance(self.model_provider, AdmissionControl):
+                    context.response += f'* admission: {self.model_provider.stats()}\n'
+                if self.memory is not None:
+                    context.response += f'* memory: {self.memory.stats()}\n'
 
             context.response += f'### PlanRepo: \n'
             context.response += f'* Number of plans: {len(self.plans)}\n'
+            risky = self.plans.risky()
+            if risky:
+                context.response += f'* Risky regex rules: {len(risky)} (over budget: {sum(1 for *_, overruns in risky if overruns)})\n'
             plan_str : str = str(self.plans)
             context.response += "```\n" + plan_str[0:1500] + "\n```"
 
 
 
+        elif context['message'] == '/stats':
+            context.response = f'### Version: {BotMessage.VERSION}\n'
+            context.response += f'### Model Provider metrics:\n'
+            context.response += Metrics.DEFAULT.summary()
+
+        elif context['message'] == '/forget':
+            context.response = f'### Version: {BotMessage.VERSION}\n'
+            if self.memory is not None:
+                self.memory.forget(context)
+            context.response += f'### This conversation is forgotten!'
+
         elif context['message'] == '/reload':
             context.response = f'### Version: {BotMessage.VERSION}\n'
-            self.plans.clear()
             if self.rule_file:
-                context.response += f'### Loading: {self.rule_file}\n'
-                self.load(file_name=self.rule_file)
-            context.response += f'### Reloaded with {len(self.plans)} plans!'
+                # Parse off the caller's thread; current plans keep serving until the swap
+                context.response += f'### Reloading: {self.rule_file}\n'
+                threading.Thread(target=self.reload, name=f'{self.id}-reload', daemon=True).start()
+            context.response += f'### Serving {len(self.plans)} plans until the new ones are ready!'
+
+        else:
+            # Only the picked response is compiled; alternatives are only needed for the debug trace
+            match = self.plans.match(context, alternatives=self.debug)
+            context.result, context.score, context.alternatives = match.result, match.score, match.alternatives
+            if match and self.debug: print(f'SimpleEngine: response={context.result}, alternatives={len(context.alternatives)}, score={context.score}')
+
+            if not match:
+                context.response = "#### DEFAULT: There are no rules setup for this request!"
 
-        elif context in self.plans:
-            if self.debug: print(f'SimpleEngine: response={context.result}, alternatives={len(context.alternatives)}, score={context.score}')
-            if self.is_action(context.result):
+            elif self.is_action(context.result):
                 command, prompt = context.result.split('/', maxsplit=1) if '/' in context.result else (context.result, '')
                 print('-->', command, prompt, context['message'])
                 
                 if command == '@prompt' and self.model_provider:
-                    prompt = prompt + '\n' + context['message']
+                    history = self.memory.history(context) if self.memory is not None else ''
+                    prompt = prompt + '\n' + (history + 'User: ' if history else '') + context['message']
                     print('E--> requesting:', prompt)
-                    context.response = self.model_provider.request(prompt)
+                    return prompt
                     
             else: 
                 context.response = context.compile(context.result)
-        else:
-            context.response = "#### DEFAULT: There are no rules setup for this request!"
-        return 
+        return None 
 
 
 
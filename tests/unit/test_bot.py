@@ -0,0 +1,61 @@
+from owlmind.bot import BotMessage, ConversationMemory
+from owlmind.context import ContextRecord, ContextRepo
+import time
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+class FakeMessage(BotMessage):
+    DERIVED = dict(BotMessage.DERIVED, channel_name=lambda m: m.source["channel"])
+
+
+def test_derived_fields_are_computed_on_first_access_only():
+    msg = BotMessage(message="hello")
+
+    assert "date" not in dict.keys(msg)
+    assert msg["date"] == msg["timestamp"].strftime("%d-%b-%Y")
+    assert "date" in dict.keys(msg)
+    assert msg["server_name"] == ""
+    assert msg.response is None
+
+
+def test_derived_fields_are_visible_to_match_and_compile():
+    repo = ContextRepo()
+    repo += ContextRecord(condition={"channel_name": "general", "message": "*hi*"}, action="Hi from general")
+    msg = FakeMessage(source={"channel": "general"}, message="hi there")
+
+    assert repo.match(msg).result == "Hi from general"
+    assert msg.compile("#$channel_name") == "#general"
+    assert FakeMessage(source={"channel": "dev"}, message="hi").compile("$missing") == "$missing"
+
+
+def test_memory_keeps_recent_turns_per_author_and_channel_within_the_budget():
+    memory = ConversationMemory(max_tokens=20)
+    alice, bob = BotMessage(layer2=1, layer4="alice"), BotMessage(layer2=1, layer4="bob")
+    memory.add(alice, "hi", "hello")
+    memory.add(alice, "how are you?", "fine")
+
+    assert memory.history(alice) == "User: hi\nAssistant: hello\nUser: how are you?\nAssistant: fine\n"
+    assert memory.history(bob) == ""
+    assert memory.history(BotMessage(layer2=2, layer4="alice")) == ""  # other channel
+
+    memory.add(alice, "x" * 40, "y")  # the oldest turns go over the budget
+    assert memory.history(alice).startswith("User: xxx")
+    memory.add(alice, "z" * 200, "long")  # one turn over the budget is cut to it
+    assert ConversationMemory.tokens(memory.history(alice)) == 20
+    assert memory.stats() == {"sessions": 1, "tokens": 20}
+
+
+def test_memory_drops_least_recently_used_and_idle_sessions(monkeypatch):
+    memory = ConversationMemory(max_sessions=2, ttl=60)
+    users = [BotMessage(layer4=user) for user in range(3)]
+    for user in users[:2]:
+        memory.add(user, "hi", "hello")
+    memory.history(users[0])
+    memory.add(users[2], "hi", "hello")  # drops user 1, least recently used
+
+    assert [bool(memory.history(user)) for user in users] == [True, False, True]
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert memory.history(users[0]) == "" and len(memory) == 0
@@ -1,4 +1,5 @@
-from owlmind.context import Context
+from owlmind.context import Context, ContextClause, ContextIndex, ContextRecord, ContextRepo, WildcardAutomaton
+import time
 import pytest
 
 pytestmark = pytest.mark.unit
@@ -47,3 +48,186 @@ def test_contains_overload_returns_correct_value_on_regex(pattern, target, expec
     ctx_two = Context({"key": pattern})
 
     assert (ctx_two in ctx) == expected
+
+
+@pytest.mark.parametrize(
+    "pattern, kind",
+    [
+        ("hello", ContextIndex.EXACT),
+        ("hello*", ContextIndex.PREFIX),
+        ("*hello", ContextIndex.SUFFIX),
+        ("*hello*", ContextIndex.WILDCARD),
+        ("*", ContextIndex.SCAN),
+        ("r/hel+o", ContextIndex.SCAN),
+        ("*hel*lo*", ContextIndex.WILDCARD),
+    ],
+)
+def test_index_classifies_pattern_kinds(pattern, kind):
+    assert ContextIndex.classify(pattern)[0] == kind
+
+
+def test_index_candidates_only_include_records_that_can_match():
+    index = ContextIndex()
+    hello = ContextRecord(condition={"message": "*hello*"}, action="hi")
+    bye = ContextRecord(condition={"message": "bye*"}, action="bye")
+    general = ContextRecord(condition={"channel_name": "general", "message": "*"}, action="general")
+    index.add(hello)
+    index.add(bye)
+    index.add(general)
+
+    assert index.candidates(Context({"message": "Hello there", "channel_name": "general"})) == [hello, general]
+    assert index.candidates(Context({"message": "bye now", "channel_name": "dev"})) == [bye]
+
+
+@pytest.mark.parametrize(
+    "pattern, text, expected",
+    [
+        ("*good*morning*", "good sunny morning", True),
+        ("*good*morning*", "morning, good", False),
+        ("hi*there", "hi over there", True),
+        ("hi*there", "oh hi there", False),
+        ("*aa*aa*", "aaa", False),
+    ],
+)
+def test_wildcard_automaton_reports_pieces_in_order(pattern, text, expected):
+    automaton = WildcardAutomaton()
+    automaton.add(pattern, "rule")
+
+    assert (automaton.scan(text) == ["rule"]) == expected
+
+
+def test_matcher_is_compiled_once_and_dropped_on_change():
+    test = Context({"key": "val*"})
+    matcher = test.matcher()
+
+    assert test.matcher() is matcher
+    assert Context({"key": "value"}).match(test)
+
+    test["key"] = "other"
+    assert test.matcher() is not matcher
+    assert not Context({"key": "value"}).match(test)
+
+    test.update(key="*bye*")
+    assert Context({"key": "bye"}).match(test)
+    test.update({"channel": "dev"})
+    assert not Context({"key": "bye"}).match(test)
+    del test["channel"]
+    assert Context({"key": "bye"}).match(test)
+
+
+def test_repo_match_returns_result_without_touching_test_or_records():
+    repo = ContextRepo()
+    record = ContextRecord(condition={"message": "*hello*"}, action="Hi!")
+    repo += record
+    repo += ContextRecord(condition={"message": "*"}, action="Sorry?")
+    test = Context({"message": "hello there"})
+
+    result = repo.match(test)
+
+    assert result.result == "Hi!"
+    assert result.alternatives == ()
+    assert result.matching == ((record, result.score),)  # the catch-all '*' could not beat it
+    assert repo.match(test, alternatives=True).alternatives == ("Hi!",)
+    assert not hasattr(test, "result")
+    assert not hasattr(record.context, "score")
+    with pytest.raises(AttributeError):
+        result.score = 0
+
+
+def test_compile_uses_parsed_template_and_keeps_sequences():
+    parent = Context({"name": "FK"})
+    ctx = Context({"code": "4567"}, parent=parent)
+
+    assert Context.template("Code for $name: ${code}!") == ("Code for ", ("name", "$name"), ": ", ("code", "${code}"), "!")
+    assert ctx.compile("Code for $name: ${code}, $missing") == "Code for FK: 4567, $missing"
+    assert ctx.compile(("@print", "$code")) == ("@print", "4567")
+    assert ctx.compile(["fixed"]) == ["fixed"]
+
+
+def test_fingerprint_is_content_based_and_refreshed_on_change():
+    ctx = Context({"code": "3333", "attachments": ["a.png"]})
+    same = Context({"attachments": ["a.png"], "code": "3333"})
+
+    assert hash(ctx) == hash(same)
+    assert hash(ContextRecord({"message": "*hi*"}, "Hi")) == hash(ContextRecord({"message": "*hi*"}, "Hi"))
+    assert hash(ContextRecord({"message": "*hi*"}, "Hi")) != hash(ContextRecord({"message": "*hi*"}, "Hey"))
+
+    ctx["sub/code"] = "4444"
+    assert hash(ctx) != hash(same)
+    ctx["sub/code"] = "3333"
+    same["sub/code"] = "3333"
+    assert hash(ctx) == hash(same)
+
+    # every dict mutator refreshes it
+    before = hash(ctx)
+    for change in [lambda c: c.update(code="5555"), lambda c: c.update({"code": "3333"}), lambda c: c.pop("code"),
+                   lambda c: c.setdefault("code", "3333"), lambda c: c.__delitem__("attachments"),
+                   lambda c: c.__ior__({"attachments": ["a.png"]}), lambda c: c.popitem(), lambda c: c.clear()]:
+        change(ctx)
+        assert hash(ctx) == Context.digest(ctx) and hash(ctx) != before
+        before = hash(ctx)
+
+
+def test_path_is_interned_and_resolves_levels():
+    parent = Context({"name": "FK"})
+    ctx = Context(parent=parent)
+    ctx[Context.path("api/code")] = "2345"
+    ctx["code"] = "4567"
+
+    assert Context.path("api/code") is Context.path("api/code")
+    assert ctx["api/code"] == "2345"
+    assert ctx["api/../code"] == "4567"
+    assert ctx["api/*/name"] == "FK"
+    assert ctx["api/missing/code"] is None
+    assert ctx.compile("${api/code} for $name") == "2345 for FK"
+
+
+def test_index_partitions_exact_values_so_other_scopes_are_never_visited():
+    index = ContextIndex()
+    records = {
+        server: ContextRecord(condition={"server_name": server, "message": "*hello*"}, action=f"Hi {server}")
+        for server in ("FAU", "MIT", "UCF")
+    }
+    anywhere = ContextRecord(condition={"message": "*hello*"}, action="Hi")
+    for record in records.values():
+        index.add(record)
+    index.add(anywhere)
+
+    assert len(index) == 4
+    assert index.candidates(Context({"server_name": "mit", "message": "hello"})) == [records["MIT"], anywhere]
+    assert index.candidates(Context({"server_name": "#dm", "message": "hello"})) == [anywhere]
+
+
+def test_backtracking_analyzer_flags_nested_and_overlapping_repeats():
+    assert ContextClause.backtracking(r"(a+)+b")
+    assert ContextClause.backtracking(r"(\w+\s?)*$")
+    assert ContextClause.backtracking(r"(a|ab)*c")
+    assert ContextClause.backtracking(r"hello.*world.*") is None
+    assert ContextClause.backtracking(r"(a|b)*c") is None
+    assert ContextClause.backtracking(r"(aa)+") is None
+
+
+def test_risky_regex_runs_under_budget_and_records_overruns(monkeypatch):
+    monkeypatch.setattr(Context, "REGEX_BUDGET", 0.05)
+    repo = ContextRepo()
+    evil = ContextRecord(condition={"message": "r/(a+)+b/"}, action="evil")
+    repo += evil
+    repo += ContextRecord(condition={"message": "*"}, action="any")
+
+    assert repo.match(Context({"message": "aaab"})).result == "evil"
+    assert repo.match(Context({"message": "a" * 40})).result == "any"
+    assert repo.risky() == [(evil, "message", ContextClause.backtracking("(a+)+b"), 1)]
+
+
+def test_risky_regexes_share_one_budget_per_message(monkeypatch):
+    monkeypatch.setattr(Context, "REGEX_BUDGET", 0.1)
+    repo = ContextRepo()
+    for i in range(10):
+        repo += ContextRecord(condition={"message": "r/(a+)+x/", "rule": "*"}, action=f"evil-{i}")
+    repo += ContextRecord(condition={"message": "*"}, action="any")
+    repo.match(Context({"message": "aaax", "rule": "1"}))  # the watchdog is up
+
+    started = time.perf_counter()
+    assert repo.match(Context({"message": "a" * 40, "rule": "1"})).result == "any"
+    assert time.perf_counter() - started < 0.5
+    assert sum(overruns for *_, overruns in repo.risky()) == 1  # the others were not run
@@ -0,0 +1,97 @@
+from owlmind.discord import DiscordBot
+import asyncio
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+class FakeMessage:
+    def __init__(self, channel, content):
+        self.channel, self.content = channel, content
+
+    async def edit(self, content):
+        self.content = content
+        self.channel.log.append(("edit", content))
+
+
+class FakeChannel:
+    def __init__(self):
+        self.log = []
+
+    async def send(self, content):
+        self.log.append(("send", content))
+        return FakeMessage(self, content)
+
+
+async def pieces(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_send_stream_posts_a_placeholder_and_edits_it_in_batches(monkeypatch):
+    monkeypatch.setattr(DiscordBot, "EDIT_INTERVAL", 60)
+    channel = FakeChannel()
+    bot = DiscordBot(token=None, engine=None)
+
+    text = asyncio.run(bot.send_stream(channel, pieces("Hello", ",", " world")))
+
+    assert text == "Hello, world"
+    # the first piece shows right away, the rest waits for the final edit
+    assert channel.log == [("send", DiscordBot.PLACEHOLDER), ("edit", "Hello"), ("edit", "Hello, world")]
+
+
+def test_send_stream_continues_long_answers_in_new_messages(monkeypatch):
+    monkeypatch.setattr(DiscordBot, "MAX_LENGTH", 5)
+    channel = FakeChannel()
+    bot = DiscordBot(token=None, engine=None)
+
+    assert asyncio.run(bot.send_stream(channel, pieces("abcd", "efgh"))) == "abcdefgh"
+    assert [entry for entry in channel.log if entry[0] == "send"] == [("send", DiscordBot.PLACEHOLDER), ("send", "fgh")]
+    assert channel.log[-1] == ("send", "fgh")
+
+
+class FakeProvider:
+    model, base_url = "fake", "http://gpu"
+
+    def __init__(self):
+        self.warm_ups = self.pingers = self.closed = 0
+
+    async def awarm_up(self):
+        self.warm_ups += 1
+        return True
+
+    async def keep_warm(self):
+        self.pingers += 1
+
+    async def aclose(self):
+        self.closed += 1
+
+
+class FakeEngine:
+    def __init__(self, provider):
+        self.model_provider, self.debug, self.streaming = provider, False, False
+
+
+def test_warm_up_runs_once_although_discord_reconnects():
+    provider = FakeProvider()
+    bot = DiscordBot(token=None, engine=FakeEngine(provider))
+
+    async def reconnect():
+        await bot.warm_up()
+        await bot.warm_up()
+        await bot.keep_warm
+
+    asyncio.run(reconnect())
+    assert (provider.warm_ups, provider.pingers) == (1, 1)
+
+
+def test_close_stops_the_pings_and_closes_the_provider_connections():
+    provider = FakeProvider()
+    bot = DiscordBot(token=None, engine=FakeEngine(provider))
+
+    async def run_and_close():
+        await bot.warm_up()
+        await bot.close()
+
+    asyncio.run(run_and_close())
+    assert (bot.keep_warm, provider.closed) == (None, 1)
@@ -0,0 +1,380 @@
+from owlmind.pipeline import AdmissionControl, Metrics, ModelProvider, ProviderPool, ResponseCache
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import urllib.request
+import pytest
+
+pytestmark = pytest.mark.unit
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = set()
+    calls = 0
+    delay = 0
+    payloads = []
+
+    def do_GET(self):
+        catalog = {"/api/tags": {"models": [{"name": "fake"}, {"name": "other"}]},
+                   "/api/models": {"data": [{"id": "fake"}]}}
+        self.reply(json.dumps(catalog[self.path]).encode() if self.path in catalog else b"", 200 if self.path in catalog else 404)
+
+    def do_POST(self):
+        FakeOllama.connections.add(self.client_address)
+        FakeOllama.calls += 1
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeOllama.payloads.append(payload)
+        time.sleep(FakeOllama.delay)
+        if "prompt" not in payload and "messages" not in payload:  # Ollama, load the model only
+            body = json.dumps({"model": payload["model"], "response": "", "done": True}).encode()
+        elif self.path == "/api/chat/completions":  # Open WebUI, as Server-Sent Events
+            prompt = payload["messages"][0]["content"]
+            events = [{"choices": [{"delta": {"content": word}}]} for word in ["echo:", " ", prompt]]
+            body = "".join(f"data: {json.dumps(event)}\n\n" for event in events).encode() + b"data: [DONE]\n\n"
+        elif payload["stream"]:  # Ollama, as NDJSON
+            lines = [{"response": word, "done": False} for word in ["echo:", " ", payload["prompt"]]]
+            body = "".join(json.dumps(line) + "\n" for line in lines + [{"response": "", "done": True}]).encode()
+        else:
+            body = json.dumps({"response": f"echo: {payload['prompt']}", "auth": self.headers.get("Authorization")}).encode()
+        self.reply(body)
+
+    def reply(self, body, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    FakeOllama.connections = set()
+    FakeOllama.delay = 0
+    FakeOllama.payloads = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllama)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_requests_reuse_one_keep_alive_connection(server):
+    provider = ModelProvider(base_url=server, type="ollama", api_key="secret", model="fake")
+
+    assert provider.request("1+1") == "echo: 1+1"
+    assert provider.request("2+2") == "echo: 2+2"
+    assert provider.response["auth"] == "Bearer secret"
+    assert len(FakeOllama.connections) == 1
+    provider.close()
+
+
+def test_read_timeout_bounds_a_hung_backend(server):
+    FakeOllama.delay = 0.5
+    provider = ModelProvider(base_url=server, type="ollama", model="fake", read_timeout=0.1)
+
+    assert provider.request("1+1").startswith("!!ERROR!! Request timed out")
+    provider.close()
+
+
+def test_arequest_runs_many_prompts_at_once_on_one_loop(server):
+    FakeOllama.delay = 0.3
+    provider = ModelProvider(base_url=server, type="ollama", model="fake")
+
+    async def main():
+        started = time.perf_counter()
+        results = await asyncio.gather(*(provider.arequest(f"{i}+{i}") for i in range(5)))
+        await provider.aclose()
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(main())
+    assert results == [f"echo: {i}+{i}" for i in range(5)]
+    assert elapsed < 1.0
+
+
+def test_asession_of_a_previous_event_loop_is_closed(server):
+    provider = ModelProvider(base_url=server, type="ollama", model="fake")
+    sessions = [asyncio.run(provider.asession()) for _ in range(2)]
+
+    assert sessions[0].closed and not sessions[1].closed
+    asyncio.run(provider.aclose())
+    assert sessions[1].closed
+    provider.close()
+
+
+@pytest.mark.parametrize("type", ["ollama", "open-webui"])
+def test_stream_yields_the_pieces_as_they_arrive(server, type):
+    provider = ModelProvider(base_url=server, type=type, model="fake")
+
+    async def collect():
+        chunks = [chunk async for chunk in provider.astream("1+1")]
+        await provider.aclose()
+        return chunks
+
+    assert list(provider.stream("1+1")) == ["echo:", " ", "1+1"]
+    assert asyncio.run(collect()) == ["echo:", " ", "1+1"]
+    assert provider.result == "echo: 1+1"
+    provider.close()
+
+
+def test_cache_answers_repeated_prompts_without_the_backend(server, tmp_path):
+    cache = ResponseCache(maxsize=2, path=str(tmp_path / "responses.db"))
+    provider = ModelProvider(base_url=server, type="ollama", model="fake", cache=cache)
+
+    assert provider.request("What is  OwlMind?") == "echo: What is  OwlMind?"
+    assert provider.request(" what is owlmind? ") == "echo: What is  OwlMind?"
+    assert asyncio.run(provider.arequest("WHAT IS OWLMIND?")) == "echo: What is  OwlMind?"
+    assert list(provider.stream("what is owlmind?")) == ["echo: What is  OwlMind?"]
+    assert provider.request("What is OwlMind?", temperature=0) == "echo: What is OwlMind?"  # other options
+    assert cache.stats() == {"size": 2, "hits": 3, "disk_hits": 0, "misses": 2}
+
+    # the disk tier survives a restart
+    provider.cache = ResponseCache(path=str(tmp_path / "responses.db"))
+    FakeOllama.delay = 5
+    assert provider.request("what is owlmind?") == "echo: What is  OwlMind?"
+    assert provider.cache.stats() == {"size": 1, "hits": 1, "disk_hits": 1, "misses": 0}
+    provider.close()
+
+
+def test_cache_drops_expired_and_least_recently_used_responses(monkeypatch):
+    cache = ResponseCache(maxsize=2, ttl=10)
+    now = time.time()
+    for prompt in ["a", "b"]:
+        cache.put(ResponseCache.key("ollama", "fake", prompt), prompt.upper())
+    assert cache.get(ResponseCache.key("ollama", "fake", "a")) == "A"
+    cache.put(ResponseCache.key("ollama", "fake", "c"), "C")  # drops "b", least recently used
+
+    assert cache.get(ResponseCache.key("ollama", "fake", "b")) is None
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get(ResponseCache.key("ollama", "fake", "a")) is None
+    assert cache.stats() == {"size": 1, "hits": 1, "disk_hits": 0, "misses": 2}
+
+
+def test_cache_file_is_purged_and_bounded_as_responses_are_written(monkeypatch, tmp_path):
+    monkeypatch.setattr(ResponseCache, "PURGE_EVERY", 1)
+    cache = ResponseCache(ttl=10, path=str(tmp_path / "responses.db"), maxrows=3)
+    now = time.time()
+    cache.put("old", "OLD")
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    for key in "abcd":
+        asyncio.run(cache.aput(key, key.upper()))
+
+    keys = [row[0] for row in cache._disk.execute("SELECT key FROM responses ORDER BY rowid")]
+    assert keys == ["b", "c", "d"]  # "old" expired, "a" beyond maxrows
+    cache._memory.clear()
+    assert asyncio.run(cache.aget("d")) == "D"
+    assert cache.get("a") is None
+    assert cache.stats() == {"size": 1, "hits": 1, "disk_hits": 1, "misses": 1}
+
+
+def test_identical_requests_in_flight_share_one_backend_call(server):
+    FakeOllama.delay = 0.3
+    FakeOllama.calls = 0
+    provider = ModelProvider(base_url=server, type="ollama", model="fake")
+
+    threads = [threading.Thread(target=provider.request, args=("1+1",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (FakeOllama.calls, provider.coalesced) == (1, 3)
+
+    async def burst():
+        results = await asyncio.gather(*(provider.arequest(prompt) for prompt in ["2+2", "2+2", "3+3"]))
+        await provider.aclose()
+        return results
+
+    assert asyncio.run(burst()) == ["echo: 2+2", "echo: 2+2", "echo: 3+3"]
+    assert (FakeOllama.calls, provider.coalesced) == (3, 4)
+    provider.close()
+
+
+@pytest.mark.parametrize("type, names", [("ollama", ["fake", "other"]), ("open-webui", ["fake"])])
+def test_models_lists_the_catalog_of_the_provider(server, type, names):
+    assert ModelProvider(base_url=server, type=type).models() == names
+    assert ModelProvider(base_url="http://127.0.0.1:9", type=type).models() is None
+
+
+def test_warm_up_loads_the_model_and_keep_warm_pings_it_when_idle(server):
+    provider = ModelProvider(base_url=server, type="ollama", model="fake", keep_alive="30m", ping_interval=0.2)
+
+    assert provider.warm_up()
+    assert FakeOllama.payloads == [{"model": "fake", "keep_alive": "30m"}]
+    provider.request("1+1")
+    assert FakeOllama.payloads[-1]["keep_alive"] == "30m"
+
+    async def idle(seconds):
+        pinger = asyncio.create_task(provider.keep_warm())
+        await asyncio.sleep(seconds)
+        pinger.cancel()
+        await provider.aclose()
+
+    FakeOllama.payloads = []
+    asyncio.run(idle(0.5))
+    assert FakeOllama.payloads == [{"model": "fake", "keep_alive": "30m"}] * 2
+    provider.close()
+
+
+class FakeProvider:
+    def __init__(self, name, delay=0, fail=False):
+        self.base_url, self.type, self.model, self.cache = name, "ollama", "fake", None
+        self.delay, self.fail, self.calls = delay, fail, 0
+
+    def request(self, prompt):
+        self.calls += 1
+        time.sleep(self.delay)
+        return "!!ERROR!! down" if self.fail else f"{self.base_url}: {prompt}"
+
+    async def arequest(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return "!!ERROR!! down" if self.fail else f"{self.base_url}: {prompt}"
+
+    def close(self):
+        pass
+
+
+def test_pool_prefers_idle_providers_and_ejects_failing_ones():
+    slow, fast = FakeProvider("slow", delay=0.2), FakeProvider("fast")
+    pool = ProviderPool([slow, fast])
+
+    async def burst():
+        return await asyncio.gather(*(pool.arequest(str(i)) for i in range(2)))
+
+    assert sorted(asyncio.run(burst())) == ["fast: 1", "slow: 0"]  # one in flight on each
+
+    down = FakeProvider("down", fail=True)
+    pool = ProviderPool([down, FakeProvider("up")], max_failures=1, cooldown=60)
+    assert pool.request("1") == "up: 1"  # retried on the other provider
+    assert [pool.request(str(i)) for i in range(3)] == ["up: 0", "up: 1", "up: 2"]
+    assert down.calls == 1
+
+
+def test_identical_prompts_are_coalesced_before_the_pool_and_the_admission_slots():
+    first, second = FakeProvider("first", delay=0.1), FakeProvider("second", delay=0.1)
+    pool = ProviderPool([first, second])
+    gate = AdmissionControl(pool, max_concurrent=1, max_queue=0)
+
+    async def burst(provider):
+        return await asyncio.gather(*(provider.arequest("1+1") for _ in range(4)))
+
+    assert asyncio.run(burst(pool)) == ["first: 1+1"] * 4
+    assert (first.calls + second.calls, pool.coalesced) == (1, 3)
+    assert asyncio.run(burst(gate)) == ["second: 1+1"] * 4  # none shed: one slot for all
+    assert (first.calls + second.calls, gate.stats()["shed"], gate.coalesced) == (2, 0, 3)
+
+    threads = [threading.Thread(target=gate.request, args=("2+2",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (first.calls + second.calls, gate.stats()["shed"]) == (3, 0)
+
+
+def test_pool_hedges_requests_slower_than_the_p95_latency(monkeypatch):
+    monkeypatch.setattr(ProviderPool, "HEDGE_SAMPLES", 1)
+    stuck, quick = FakeProvider("stuck"), FakeProvider("quick", delay=0.05)
+    pool = ProviderPool([stuck, quick], hedge=True)
+    pool._latencies.append(0.05)
+    stuck.delay = 1.0
+
+    started = time.perf_counter()
+    assert pool.request("1") == "quick: 1"
+    assert time.perf_counter() - started < 0.5
+    assert asyncio.run(pool.arequest("2")) == "quick: 2"
+    assert pool.hedged == 2
+    pool.close()
+
+
+def test_pool_does_not_hedge_requests_answered_under_the_threshold():
+    quick, other = FakeProvider("quick", delay=0.01), FakeProvider("other", delay=0.01, fail=True)
+    pool = ProviderPool([quick, other], hedge=True)
+    pool._latencies.extend([1.0] * 30)
+
+    assert pool.request("1") == "quick: 1"
+    assert asyncio.run(pool.arequest("2")) == "quick: 2"  # the failing one (faster so far) answers first: retried
+    pool.members[0].ejected_until = time.monotonic() + 60
+    assert pool.request("3") == "quick: 3"
+    assert (pool.hedged, quick.calls, other.calls) == (0, 3, 2)
+    pool.close()
+
+
+def test_pool_keeps_slower_providers_whose_hedged_requests_were_cancelled(monkeypatch):
+    monkeypatch.setattr(ProviderPool, "HEDGE_SAMPLES", 1)
+    slow, quick = FakeProvider("slow", delay=0.3), FakeProvider("quick", delay=0.01)
+    pool = ProviderPool([slow, quick], policy=ProviderPool.LATENCY, hedge=True)
+    pool._latencies.append(0.02)
+    pool.members[1].latency = 1.0  # pick the slow one first
+
+    async def burst():
+        return [await pool.arequest(str(i)) for i in range(5)]
+
+    assert asyncio.run(burst()) == [f"quick: {i}" for i in range(5)]
+    assert pool.hedged == 5
+    member = pool.members[0]
+    assert (member.failures, member.ejected_until, member.outstanding, member.latency) == (0, 0.0, 0, 0.0)
+
+
+def test_admission_caps_concurrency_serves_by_priority_and_sheds_when_full():
+    provider = FakeProvider("gpu", delay=0.1)
+    gate = AdmissionControl(provider, max_concurrent=1, max_queue=2)
+    order = []
+
+    async def ask(prompt, priority, after=0):
+        await asyncio.sleep(after)
+        result = await gate.arequest(prompt, priority=priority)
+        order.append(prompt)
+        return result
+
+    async def burst():
+        return await asyncio.gather(ask("first", AdmissionControl.NORMAL),
+                                    ask("normal", AdmissionControl.NORMAL, 0.01),
+                                    ask("dm", AdmissionControl.DIRECT, 0.02),
+                                    ask("late", AdmissionControl.SHORT, 0.03))
+
+    results = asyncio.run(burst())
+    assert results == ["gpu: first", "gpu: normal", "gpu: dm", AdmissionControl.BUSY]
+    assert order == ["late", "first", "dm", "normal"]  # shed at once, then by priority
+    assert gate.stats() == {"active": 0, "waiting": 0, "admitted": 3, "queued": 2, "shed": 1, "coalesced": 0}
+
+
+def test_admission_sheds_requests_waiting_too_long():
+    gate = AdmissionControl(FakeProvider("gpu", delay=0.3), max_concurrent=1, max_wait=0.05)
+    slow = threading.Thread(target=gate.request, args=("first",))
+    slow.start()
+    time.sleep(0.05)
+
+    assert gate.request("second") == AdmissionControl.BUSY
+    slow.join()
+    assert gate.request("third") == "gpu: third"
+
+
+def test_metrics_record_latency_status_and_sizes_per_provider(server):
+    metrics = Metrics()
+    provider = ModelProvider(base_url=server, type="ollama", model="fake", cache=ResponseCache(), metrics=metrics)
+    provider.request("1+1")
+    provider.request("1+1")  # from the cache: no request
+    asyncio.run(provider.arequest("2+2"))
+    list(provider.stream("3+3"))
+    ModelProvider(base_url="http://127.0.0.1:9", type="ollama", model="fake", metrics=metrics).request("1+1")
+
+    exported = metrics.export()
+    labels = f'type="ollama",model="fake",provider="{server}"'
+    assert f'owlmind_model_requests_total{{{labels},status="200"}} 3' in exported
+    assert 'provider="http://127.0.0.1:9",status="error"} 1' in exported
+    assert f'owlmind_model_request_seconds_count{{{labels}}} 3' in exported
+    assert f'owlmind_model_ttfb_seconds_bucket{{{labels},le="+Inf"}} 3' in exported
+    assert f'owlmind_model_cache_total{{{labels},result="hit"}} 1' in exported
+    assert "# TYPE owlmind_model_response_bytes histogram" in exported
+    assert f"fake @ {server}: 3 requests, 0 errors" in metrics.summary()
+
+    endpoint = metrics.serve(port=0)
+    with urllib.request.urlopen(f"http://127.0.0.1:{endpoint.server_address[1]}/metrics") as response:
+        assert response.read().decode() == metrics.export()
+    endpoint.shutdown()
+    provider.close()
@@ -1,5 +1,9 @@
 from owlmind.simple import SimpleEngine
+from owlmind import simple
 from owlmind.context import Context
+from owlmind.bot import BotMessage
+import asyncio
+import time
 import pytest
 
 pytestmark = pytest.mark.unit
@@ -18,6 +22,9 @@ def test_load():
 
     simple_uut.load(FAKE_RULES_PATH)
 
+    # loading the same rules twice must not duplicate them
+    assert len(simple_uut.plans) == 10
+
     ctx = Context({"message": "hello"})
     ctx2 = Context({"message": "good morning"})
 
@@ -36,3 +43,186 @@ def test_load():
 
     # this is the generic wildcard match for when a message is received with no better match
     assert ctx3.result is None
+
+
+def test_process_compiles_only_the_picked_response():
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(FAKE_RULES_PATH)
+
+    ctx = BotMessage(message="good evening to you")
+    simple_uut.process(ctx)
+
+    assert ctx.response == "Good evening! What brings you here?"
+    assert ctx.alternatives == ()
+
+    ctx = BotMessage(message="Where is the bathroom?")
+    simple_uut.process(ctx)
+
+    assert ctx.response == "#### DEFAULT: There are no rules setup for this request!"
+
+
+def test_reload_swaps_plans_and_reuses_unchanged_rules(tmp_path):
+    rules = tmp_path / "rules.csv"
+    rules.write_text("message,response\n*hello*, Hi!\n*bye*, Bye!\n", encoding="utf-8")
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(rules))
+    live = simple_uut.plans
+    hello = next(plan for plan in live["_"] if plan.action == "Hi!")
+
+    rules.write_text("message,response\n*hello*, Hi!\n*morning*, Good morning!\n", encoding="utf-8")
+    announcement = simple_uut.reload()
+
+    assert simple_uut.plans is not live
+    assert len(live) == 2  # the old plans are left untouched
+    assert announcement.endswith("reloaded 2 Rules from " + str(rules) + " (+1 -1).")
+    assert any(plan is hello for plan in simple_uut.plans["_"])
+    assert simple_uut.plans.match(BotMessage(message="good morning")).result == "Good morning!"
+
+
+def test_reload_keeps_the_plans_and_watch_keeps_running_when_a_rule_file_is_unreadable(tmp_path):
+    rules = tmp_path / "rules.csv"
+    rules.write_text("message,response\n*hello*, Hi!\n", encoding="utf-8")
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(rules))
+    live = simple_uut.plans
+
+    rules.write_bytes(b"message,response\n*hello*, \xff\xfe!\n")  # not UTF-8
+    assert simple_uut.reload() is None
+    assert simple_uut.plans is live
+
+    simple_uut.watch(interval=0.05)
+    rules.write_bytes(b"message,response\n*bye*, \xff\xfe\xff!\n")
+    time.sleep(0.3)
+    assert simple_uut._watcher[0].is_alive() and simple_uut.plans is live
+    rules.write_text("message,response\n*hello*, Hi!\n*bye*, Bye!\n", encoding="utf-8")
+    time.sleep(0.3)
+    simple_uut.unwatch()
+    assert len(simple_uut.plans) == 2
+
+
+def test_load_from_snapshot_until_the_rules_change(tmp_path):
+    rules = tmp_path / "rules.csv"
+    rules.write_text("message,response\n*hello*, Hi!\n*good*morning*, Good morning!\n", encoding="utf-8")
+    SimpleEngine(id="fake_id").compile(str(rules))
+    assert (tmp_path / ("rules.csv" + SimpleEngine.SNAPSHOT)).exists()
+
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(rules), snapshot=True)
+    assert len(simple_uut.plans) == 2
+    assert simple_uut.plans.match(BotMessage(message="good sunny morning")).result == "Good morning!"
+
+    # the snapshot is stale once the rule file changes: it is rebuilt from the CSV
+    rules.write_text("message,response\n*hello*, Hello!\n", encoding="utf-8")
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(rules), snapshot=True)
+    assert len(simple_uut.plans) == 1
+    assert simple_uut.plans.match(BotMessage(message="hello")).result == "Hello!"
+
+
+def test_load_without_a_writable_snapshot_uses_the_csv(tmp_path):
+    for name in ["a", "b"]:
+        (tmp_path / f"{name}.csv").write_text(f"message,response\n*{name}*, {name.upper()}!\n", encoding="utf-8")
+        (tmp_path / f"{name}.csv{SimpleEngine.SNAPSHOT}").mkdir()  # cannot be written
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(tmp_path / "a.csv"), snapshot=True)
+    assert len(simple_uut.plans) == 1
+
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(tmp_path), snapshot=True, workers=2)
+    assert len(simple_uut.plans) == 2
+
+
+def test_load_directory_in_parallel_with_condition_columns(tmp_path):
+    (tmp_path / "team").mkdir()
+    (tmp_path / "a.csv").write_text("message,response\n*hello*, Hi!\n", encoding="utf-8")
+    (tmp_path / "team" / "b.csv").write_text(
+        "server_name,message,response\nguild-1,*hello*, Hi guild!\n,*bye*, Bye!\n", encoding="utf-8")
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(tmp_path), workers=2)
+
+    assert len(simple_uut.plans) == 3
+    assert simple_uut.announcement.startswith(f"SimpleEngine fake_id loaded 3 Rules from {tmp_path} [a.csv: 1 in ")
+    assert "; team/b.csv: 2 in " in simple_uut.announcement
+    assert simple_uut.plans.match(BotMessage(message="hello", server_name="guild-1")).result == "Hi guild!"
+    assert simple_uut.plans.match(BotMessage(message="hello", server_name="guild-2")).result == "Hi!"
+    assert simple_uut.plans.match(BotMessage(message="bye", server_name="guild-2")).result == "Bye!"
+
+    # a glob selects some of the files
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(tmp_path / "**" / "b.csv"), workers=1)
+    assert len(simple_uut.plans) == 2
+
+    # files of a glob are named from the directory they share
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(tmp_path / "**" / "*.csv"), workers=1)
+    assert "[a.csv: 1 in " in simple_uut.announcement and "; team/b.csv: 2 in " in simple_uut.announcement
+
+
+def test_load_parses_here_only_the_files_left_when_the_pool_breaks(tmp_path, monkeypatch):
+    class BreakingPool:
+        def __init__(self, **kwargs):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def map(self, function, *iterables):
+            yield function(*next(zip(*iterables)))
+            raise simple.BrokenProcessPool("worker died")
+
+    for name in ["a", "b", "c"]:
+        (tmp_path / f"{name}.csv").write_text(f"message,response\n*{name}*, {name.upper()}!\n", encoding="utf-8")
+    monkeypatch.setattr(simple, "ProcessPoolExecutor", BreakingPool)
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(tmp_path), workers=2)
+    assert simple_uut.announcement.startswith(f"SimpleEngine fake_id loaded 3 Rules from {tmp_path} [a.csv: 1 in ")
+    assert simple_uut.announcement.count("a.csv") == 1
+
+
+def test_aprocess_awaits_the_model_provider(tmp_path):
+
+    class FakeProvider:
+        async def arequest(self, prompt):
+            await asyncio.sleep(0)
+            return f"model says: {prompt}"
+
+    rules = tmp_path / "rules.csv"
+    rules.write_text("message,response\n*joke*, @prompt/Tell a joke\n*hello*, Hi!\n", encoding="utf-8")
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(rules))
+    simple_uut.model_provider = FakeProvider()
+
+    joke, hello = BotMessage(message="a joke please"), BotMessage(message="hello")
+    asyncio.run(simple_uut.aprocess(joke))
+    asyncio.run(simple_uut.aprocess(hello))
+
+    assert joke.response == "model says: Tell a joke\na joke please"
+    assert hello.response == "Hi!"
+
+
+def test_prompts_carry_the_recent_turns_of_the_conversation(tmp_path):
+
+    class FakeProvider:
+        calls = 0
+
+        def request(self, prompt):
+            self.calls += 1
+            return f"answer {self.calls}"
+
+    rules = tmp_path / "rules.csv"
+    rules.write_text("message,response\n*, @prompt/Be nice\n", encoding="utf-8")
+    simple_uut = SimpleEngine(id="fake_id")
+    simple_uut.load(str(rules))
+    simple_uut.model_provider = FakeProvider()
+
+    for message in ["hi", "again"]:
+        simple_uut.process(BotMessage(message=message, layer4="alice"))
+    assert simple_uut.respond(BotMessage(message="more", layer4="alice")) == \
+        "Be nice\nUser: hi\nAssistant: answer 1\nUser: again\nAssistant: answer 2\nUser: more"
+    assert simple_uut.respond(BotMessage(message="hi", layer4="bob")) == "Be nice\nhi"
+
+    simple_uut.process(BotMessage(message="/forget", layer4="alice"))
+    assert simple_uut.respond(BotMessage(message="more", layer4="alice")) == "Be nice\nmore"